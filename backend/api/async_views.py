@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from foodgram.db import check_connections
+from foodgram.middleware import track_render
+from foodgram.streaming import ThreadStream
+
+ASYNC_READ_ROUTES = (
+    'recipes-list',
+    'recipes-detail',
+    'recipes-feed',
+    'recipes-download_shopping_cart',
+    'tags-list',
+    'tags-detail',
+    'ingredients-list',
+    'ingredients-detail',
+)
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS,
+    thread_name_prefix='async-read',
+)
+
+
+def call_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if callable(getattr(response, 'render', None)):
+        track_render(request, response)
+        response.render()
+    return response
+
+
+def read_view(stream, view, request, *args, **kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        if stream is not None:
+            return stream.serve(
+                partial(call_view, view, request, *args, **kwargs)
+            )
+        response = call_view(view, request, *args, **kwargs)
+        if response.streaming:
+            response.streaming_content = [
+                b''.join(response.streaming_content)
+            ]
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read(view):
+    read = sync_to_async(
+        read_view, thread_sensitive=False, executor=executor
+    )
+    write = sync_to_async(call_view)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            if not isinstance(request, ASGIRequest):
+                return await read(None, view, request, *args, **kwargs)
+            stream = ThreadStream(asyncio.get_running_loop())
+            stream.task = asyncio.ensure_future(
+                read(stream, view, request, *args, **kwargs)
+            )
+            return await stream.response
+        return await write(view, request, *args, **kwargs)
+
+    return async_view
+
+
+def async_read_urls(urls, names=ASYNC_READ_ROUTES):
+    return [
+        URLPattern(
+            url.pattern, async_read(url.callback), url.default_args, url.name
+        ) if url.name in names else url
+        for url in urls
+    ]
@@ -0,0 +1,150 @@
+import hashlib
+from threading import Lock
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.models import Ingredient, Tag
+from recipes.versions import (ingredients_version, recipes_version,
+                              tags_version)
+
+
+RECIPES_CACHE_PARAMS = (
+    'author',
+    'cursor',
+    'is_favorited',
+    'is_in_shopping_cart',
+    'ordering',
+    'page',
+    'search',
+    'tags',
+)
+MULTIPLE_PARAMS = ('tags',)
+
+
+def normalize(value):
+    return str(int(value)) if value.isdecimal() else value
+
+
+class ResponseCache:
+    def __init__(self, alias, prefix, version, params):
+        self.alias = alias
+        self.prefix = prefix
+        self.version = version
+        self.params = params
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_generation(self):
+        return self.version.get()
+
+    def bump(self):
+        self.version.bump()
+
+    def get_key(self, request, view):
+        query = []
+        for name in self.params:
+            values = request.query_params.getlist(name)
+            if name in MULTIPLE_PARAMS:
+                values = sorted(set(values))
+            else:
+                values = values[-1:]
+            query.extend((name, normalize(value)) for value in values)
+        return '{prefix}:{generation}:{action}:{pk}:{format}:{query}'.format(
+            prefix=self.prefix,
+            generation=self.get_generation(),
+            action=view.action,
+            pk=view.kwargs.get(view.lookup_url_kwarg or view.lookup_field),
+            format=request.accepted_renderer.format,
+            query=urlencode(query),
+        )
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def fetch(self, request, view, handler, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_key(request, view)
+        data = self.cache.get(key)
+        self.count(data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+recipes_cache = ResponseCache(
+    'recipes', 'recipes', recipes_version, RECIPES_CACHE_PARAMS
+)
+
+
+class CatalogETag:
+    def __init__(self, version, get_rows):
+        self.version = version
+        self.get_rows = get_rows
+        self.digest = None
+        self.digest_version = None
+        self._lock = Lock()
+
+    def get(self, request):
+        version = self.version.get()
+        with self._lock:
+            if self.digest is None or self.digest_version != version:
+                self.digest = hashlib.md5(
+                    repr(list(self.get_rows())).encode()
+                ).hexdigest()
+                self.digest_version = version
+            digest = self.digest
+        return f'"{digest}-{request.accepted_renderer.format}"'
+
+
+def conditional(request, handler, *args, etag=None, last_modified=None,
+                **kwargs):
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = handler(request, *args, **kwargs)
+    if response.status_code in (200, 304):
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+tags_etag = CatalogETag(
+    tags_version,
+    lambda: Tag.objects.order_by('pk').values_list(
+        'id', 'name', 'color', 'slug'
+    )
+)
+ingredients_etag = CatalogETag(
+    ingredients_version,
+    lambda: Ingredient.objects.order_by('pk').values_list(
+        'id', 'name', 'measurement_unit'
+    )
+)
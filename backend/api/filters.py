@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_index
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,14 +13,26 @@ class RecipeFilter(filters.FilterSet):
         method='get_is_in_shopping_cart'
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
+    search = filters.CharFilter(method='get_search')
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='get_ordering',
+    )
 
     class Meta:
-        fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited',)
+        fields = (
+            'tags',
+            'author',
+            'is_in_shopping_cart',
+            'is_favorited',
+            'search',
+            'ordering',
+        )
         model = Recipe
 
     def get_is_in_shopping_cart(self, queryset, name, value):
@@ -28,6 +45,34 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(favorites__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        if not value:
+            return queryset
+        if connection.vendor == 'postgresql':
+            query = SearchQuery(
+                value, config=settings.SEARCH_CONFIG, search_type='websearch'
+            )
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+        recipe_ids = search_index.search(value)
+        if not recipe_ids:
+            return queryset.none()
+        return queryset.filter(pk__in=recipe_ids).annotate(
+            rank=Case(
+                *(
+                    When(pk=recipe_id, then=Value(-position))
+                    for position, recipe_id in enumerate(recipe_ids)
+                ),
+                output_field=IntegerField(),
+            )
+        ).order_by('-rank')
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by('-favorites_count', '-pub_date', '-id')
+        return queryset
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from users.models import User
+from recipes.models import Recipe
+from api.readers import recipe_reader
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipesSerializer
+from api.views import annotate_flags
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает вывод быстрого сериализатора рецептов '
+        'с RecipesSerializer побайтно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='id пользователя, от имени которого строится ответ.',
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Хост для абсолютных ссылок на изображения.',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+        )
+
+    def get_request(self, options):
+        request = Request(RequestFactory().get(
+            '/api/recipes/', HTTP_HOST=options['host']
+        ))
+        request.user = AnonymousUser()
+        if options['user'] is not None:
+            request.user = User.objects.get(pk=options['user'])
+        return request
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def handle(self, *args, **options):
+        request = self.get_request(options)
+        page_size = options['page_size']
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        mismatches = 0
+        timings = dict.fromkeys(
+            ('serializer', 'reader', 'serializer_total', 'reader_total'), 0
+        )
+        for start in range(0, len(recipe_ids), page_size):
+            page_ids = recipe_ids[start:start + page_size]
+            queryset = annotate_flags(
+                Recipe.objects.filter(pk__in=page_ids), request.user
+            )
+
+            started = time.process_time()
+            recipes = list(queryset.prefetch_related(
+                'recipe_ingredients__ingredient', 'tags', 'author'
+            ))
+            loaded = time.process_time()
+            expected = JSONRenderer().render(RecipesSerializer(
+                recipes, many=True, context={'request': request}
+            ).data)
+            finished = time.process_time()
+            timings['serializer'] += finished - loaded
+            timings['serializer_total'] += finished - started
+
+            started = time.process_time()
+            rows = list(recipe_reader.values(queryset))
+            state = recipe_reader.load(rows, {'request': request})
+            loaded = time.process_time()
+            actual = ORJSONRenderer().render(recipe_reader.build(rows, state))
+            finished = time.process_time()
+            timings['reader'] += finished - loaded
+            timings['reader_total'] += finished - started
+
+            if actual != expected:
+                mismatches += 1
+                print(f'Расхождение на рецептах {page_ids}')
+                print(f'  RecipesSerializer: {expected.decode()}')
+                print(f'  RecipeReader:      {actual.decode()}')
+        print(f'Рецептов: {len(recipe_ids)}, страниц с расхождениями: '
+              f'{mismatches}')
+        for label, suffix in (('сериализация', ''), ('с запросами', '_total')):
+            serializer = timings[f'serializer{suffix}']
+            reader = timings[f'reader{suffix}']
+            print(
+                f'{label}: RecipesSerializer {serializer:.3f} с, '
+                f'RecipeReader {reader:.3f} с, '
+                f'ускорение {serializer / max(reader, 1e-9):.1f}x'
+            )
+        if mismatches:
+            raise CommandError(f'Страниц с расхождениями: {mismatches}')
@@ -0,0 +1,122 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecipeCursorPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    invalid_cursor_message = 'Неверный курсор.'
+    id_field = 'id'
+
+    def get_position(self, recipe):
+        if isinstance(recipe, dict):
+            return recipe['pub_date'], recipe[self.id_field]
+        return recipe.pub_date, recipe.pk
+
+    def encode_cursor(self, recipe, reverse):
+        pub_date, pk = self.get_position(recipe)
+        position = '{}|{}|{}'.format(pub_date.isoformat(), pk, int(reverse))
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            b64encode(position.encode()).decode()
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk, reverse = b64decode(
+                encoded.encode()
+            ).decode().split('|')
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return pub_date, int(pk), bool(int(reverse))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+        if reverse:
+            queryset = queryset.order_by('pub_date', self.id_field)
+        else:
+            queryset = queryset.order_by('-pub_date', f'-{self.id_field}')
+        if cursor is not None:
+            pub_date, pk, _ = cursor
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'{self.id_field}__{lookup}': pk})
+            )
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+
+class TimelineCursorPagination(RecipeCursorPagination):
+    id_field = 'recipe_id'
+
+
+class RecipePagination(PageNumberPagination):
+    cursor_pagination_class = RecipeCursorPagination
+    ordered_query_params = ('ordering', 'search')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        if self.cursor_pagination_class.cursor_query_param in (
+            request.query_params
+        ) and not any(
+            param in request.query_params
+            for param in self.ordered_query_params
+        ):
+            self.cursor_pagination = self.cursor_pagination_class()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,152 @@
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+
+from foodgram.middleware import track_serialization
+from recipes.models import IngredientRecipe, Recipe
+from .serializers import (
+    CustomUserSerializer,
+    IngredientRecipeSerializer,
+    RecipesSerializer,
+    TagsSerializer,
+    get_subscriptions,
+)
+
+INGREDIENT_COLUMNS = {
+    'amount': 'amount',
+    'name': 'ingredient__name',
+    'measurement_unit': 'ingredient__measurement_unit',
+    'id': 'ingredient_id',
+}
+
+
+class ReadState:
+    def __init__(self, context, tags, ingredients):
+        self.request = context.get('request')
+        self.subscriptions = get_subscriptions(context)
+        self.tags = tags
+        self.ingredients = ingredients
+
+    def url(self, name):
+        url = default_storage.url(name)
+        if self.request is None:
+            return url
+        return self.request.build_absolute_uri(url)
+
+
+class RecipeReader:
+    serializer_class = RecipesSerializer
+    scalar_fields = (
+        'id',
+        'name',
+        'text',
+        'cooking_time',
+        'is_favorited',
+        'is_in_shopping_cart',
+        'favorites_count',
+    )
+    author_fields = tuple(
+        name for name in CustomUserSerializer.Meta.fields
+        if name != 'is_subscribed'
+    )
+    tag_fields = TagsSerializer.Meta.fields
+    ingredient_fields = IngredientRecipeSerializer.Meta.fields
+
+    def __init__(self):
+        self.plan = tuple(
+            (name, self.compile(name))
+            for name in self.serializer_class.Meta.fields
+        )
+        self.columns = ('pub_date', 'author_id', 'image', 'renditions') + (
+            self.scalar_fields
+        ) + tuple(f'author__{name}' for name in self.author_fields)
+        self.tag_columns = tuple(f'tag__{name}' for name in self.tag_fields)
+        self.ingredient_columns = tuple(
+            INGREDIENT_COLUMNS[name] for name in self.ingredient_fields
+        )
+
+    def compile(self, name):
+        if name in self.scalar_fields:
+            getter = itemgetter(name)
+            return lambda row, state: getter(row)
+        reader = getattr(self, f'read_{name}', None)
+        if reader is None:
+            raise ImproperlyConfigured(
+                f'Поле {name} не поддерживается быстрым сериализатором.'
+            )
+        return reader
+
+    def read_tags(self, row, state):
+        return state.tags.get(row['id'], [])
+
+    def read_ingredients(self, row, state):
+        return state.ingredients.get(row['id'], [])
+
+    def read_author(self, row, state):
+        author = {
+            name: row[f'author__{name}'] for name in self.author_fields
+        }
+        author['is_subscribed'] = row['author_id'] in state.subscriptions
+        return author
+
+    def read_image(self, row, state):
+        if not row['image']:
+            return None
+        return state.url(row['image'])
+
+    def read_renditions(self, row, state):
+        return {
+            label: state.url(name)
+            for label, name in row['renditions'].items()
+        }
+
+    def get_tags(self, recipe_ids):
+        tags = defaultdict(list)
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('tag__name').values_list('recipe_id', *self.tag_columns)
+        for recipe_id, *values in rows:
+            tags[recipe_id].append(dict(zip(self.tag_fields, values)))
+        return tags
+
+    def get_ingredients(self, recipe_ids):
+        ingredients = defaultdict(list)
+        rows = IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('pk').values_list('recipe_id', *self.ingredient_columns)
+        for recipe_id, *values in rows:
+            ingredients[recipe_id].append(
+                dict(zip(self.ingredient_fields, values))
+            )
+        return ingredients
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def load(self, rows, context):
+        recipe_ids = {row['id'] for row in rows}
+        if not recipe_ids:
+            return ReadState(context, {}, {})
+        return ReadState(
+            context,
+            self.get_tags(recipe_ids),
+            self.get_ingredients(recipe_ids),
+        )
+
+    def build(self, rows, state):
+        plan = self.plan
+        return [
+            {name: reader(row, state) for name, reader in plan}
+            for row in rows
+        ]
+
+    def read(self, rows, context):
+        rows = list(rows)
+        state = self.load(rows, context)
+        with track_serialization(context.get('request')):
+            return self.build(rows, state)
+
+
+recipe_reader = RecipeReader()
@@ -0,0 +1,96 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        return orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=ORJSON_OPTIONS,
+        ).replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
+
+
+class ShoppingCartRenderer(BaseRenderer, ABC):
+    charset = 'utf-8'
+
+    @abstractmethod
+    def stream(self, ingredients):
+        pass
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return json.dumps(data, ensure_ascii=False).encode(self.charset)
+        return ''.join(self.stream(data or ())).encode(self.charset)
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        for ingredient in ingredients:
+            yield '{name} - {amount} {m_unit}\n'.format(
+                name=ingredient.get('ingredient__name'),
+                amount=ingredient.get('amount'),
+                m_unit=ingredient.get('ingredient__measurement_unit')
+            )
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient.get('ingredient__name'),
+                ingredient.get('amount'),
+                ingredient.get('ingredient__measurement_unit'),
+            ))
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient.get('ingredient__name'),
+                'amount': ingredient.get('amount'),
+                'measurement_unit': ingredient.get(
+                    'ingredient__measurement_unit'
+                ),
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
@@ -1,22 +1,66 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from PIL import Image
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from foodgram.middleware import track_serialization
 from users.models import User
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     IngredientRecipe,
+    ShoppingCart,
 )
+from recipes.changes import recipes_changed
+from recipes.counters import change_counter
+from recipes.images import schedule_renditions
+from recipes.shopping_cart import apply_changes
+from recipes.timeline import schedule_fan_out
 
 MIN_VALUE = 1
 MAX_VALUE = 32_000
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
-class CustomUserSerializer(UserSerializer):
+def get_subscriptions(context):
+    if 'subscriptions' not in context:
+        request = context.get('request')
+        subscriptions = set()
+        if request and request.user.is_authenticated:
+            subscriptions = set(request.user.subscribe.values_list(
+                'author_id', flat=True
+            ))
+        context['subscriptions'] = subscriptions
+    return context['subscriptions']
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with track_serialization(self.context.get('request')):
+            return super().data
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with track_serialization(self.context.get('request')):
+            return super().data
+
+
+class TimedModelSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
+    pass
+
+
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -29,33 +73,82 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed',
         )
         model = User
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        if request and request.user.is_authenticated:
-            return request.user.subscriber.exists()
-        return False
+        return obj.id in get_subscriptions(self.context)
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть в формате base64.',
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'too_wide': (
+            'Стороны изображения не должны превышать {max_dimension} px.'
+        ),
+    }
+
+    def decode(self, data):
+        header_end = data.index(';base64,')
+        content_type = data[len('data:'):header_end]
+        start = header_end + len(';base64,')
+        encoded_size = len(data) - start
+        size = encoded_size * 3 // 4 - data.endswith('=') - data.endswith('==')
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        file = TemporaryUploadedFile(
+            'temp.' + content_type.split('/')[-1], content_type, size, None
+        )
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    data[offset:offset + BASE64_CHUNK_SIZE], validate=True
+                ))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        try:
+            with Image.open(file.temporary_file_path()) as image:
+                width, height = image.size
+        except Exception:
+            return file
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            file.close()
+            self.fail(
+                'too_wide',
+                max_dimension=settings.RECIPE_IMAGE_MAX_DIMENSION
+            )
+        return file
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
         return super().to_internal_value(data)
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class RenditionsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return {
+            label: request.build_absolute_uri(default_storage.url(name))
+            if request else default_storage.url(name)
+            for label, name in value.items()
+        }
+
+
+class IngredientsSerializer(TimedModelSerializer):
     class Meta:
         fields = ('id', 'name', 'measurement_unit',)
         model = Ingredient
+        list_serializer_class = TimedListSerializer
 
 
-class TagsSerializer(serializers.ModelSerializer):
+class TagsSerializer(TimedModelSerializer):
     class Meta:
         fields = ('id', 'name', 'color', 'slug',)
         model = Tag
+        list_serializer_class = TimedListSerializer
 
 
 class IngredientRecipeSerializer(serializers.ModelSerializer):
@@ -87,13 +180,14 @@ class IngredientCreateRecipeSerializer(serializers.ModelSerializer):
         model = IngredientRecipe
 
 
-class RecipesSerializer(serializers.ModelSerializer):
+class RecipesSerializer(TimedModelSerializer):
     tags = TagsSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True, source='recipe_ingredients'
     )
     image = Base64ImageField()
+    renditions = RenditionsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -107,26 +201,33 @@ class RecipesSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'renditions',
             'text',
             'cooking_time',
+            'favorites_count',
         )
         read_only_fields = ('is_favorited', 'is_in_shopping_cart',)
         model = Recipe
+        list_serializer_class = TimedListSerializer
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
-        return user.shopping_carts.exists()
+        return user.shopping_carts.filter(recipe=obj).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
-        return user.favorites.exists()
+        return user.favorites.filter(recipe=obj).exists()
 
 
-class RecipeUpdateCreateSerializer(serializers.ModelSerializer):
+class RecipeUpdateCreateSerializer(TimedModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
@@ -153,44 +254,132 @@ class RecipeUpdateCreateSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient.get('id') for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.'
+            )
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [
+            ingredient_id for ingredient_id in ids
+            if ingredient_id not in found
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, missing))
+                )
+            )
+        return ingredients
+
     def ingredient_create(self, ingredients, recipe):
         ingredient_create = [
             IngredientRecipe(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient.get('id')),
+                ingredient_id=ingredient.get('id'),
                 amount=ingredient.get('amount'),
             )
             for ingredient in ingredients
         ]
-        IngredientRecipe.objects.bulk_create(ingredient_create)
+        if ingredient_create:
+            IngredientRecipe.objects.bulk_create(ingredient_create)
+            recipes_changed([recipe.pk], search=True, ingredients=True)
+
+    def ingredient_update(self, ingredients, recipe):
+        Recipe.objects.select_for_update().only('id').get(pk=recipe.pk)
+        amounts = {
+            ingredient.get('id'): ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        existing = {
+            ingredient.ingredient_id: ingredient
+            for ingredient in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        changes = {
+            ingredient_id: amount - getattr(
+                existing.get(ingredient_id), 'amount', 0
+            )
+            for ingredient_id, amount in amounts.items()
+        }
+        removed = existing.keys() - amounts.keys()
+        for ingredient_id in removed:
+            changes[ingredient_id] = -existing[ingredient_id].amount
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+            recipes_changed([recipe.pk], search=True, ingredients=True)
+        changed = []
+        for ingredient_id, ingredient in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient.amount:
+                ingredient.amount = amount
+                changed.append(ingredient)
+        IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        self.ingredient_create(
+            [
+                ingredient for ingredient in ingredients
+                if ingredient.get('id') not in existing
+            ],
+            recipe
+        )
+        apply_changes(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            changes
+        )
 
+    def save(self, **kwargs):
+        image = self.validated_data.get('image')
+        try:
+            return super().save(**kwargs)
+        finally:
+            if image is not None:
+                image.close()
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        self.ingredient_create(ingredients, instance)
-        instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.ingredient_update(ingredients, instance)
+        if tags is not None:
+            instance.tags.set(tags)
+        if 'image' in validated_data:
+            stale = list(instance.renditions.values())
+            validated_data['renditions'] = {}
+            transaction.on_commit(
+                lambda: schedule_renditions(instance, stale)
+            )
         super().update(instance, validated_data)
         return instance
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         author = self.context['request'].user
         recipe = Recipe.objects.create(**validated_data, author=author)
+        change_counter(User, 'recipes_count', author.id)
         self.ingredient_create(ingredients, recipe)
         recipe.tags.set(tags)
+        transaction.on_commit(lambda: schedule_renditions(recipe))
+        transaction.on_commit(lambda: schedule_fan_out(recipe))
         return recipe
 
 
-class RecipeSmallSerializer(serializers.ModelSerializer):
+class RecipeSmallSerializer(TimedModelSerializer):
+    renditions = RenditionsField()
+
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'renditions', 'cooking_time',)
         model = Recipe
+        list_serializer_class = TimedListSerializer
 
 
-class CustomUserCreateSerializer(UserCreateSerializer):
+class CustomUserCreateSerializer(TimedSerializerMixin, UserCreateSerializer):
     class Meta:
         fields = (
             'username',
@@ -203,10 +392,10 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         model = User
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(TimedModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         fields = (
@@ -220,6 +409,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'recipes_count',
         )
         model = User
+        list_serializer_class = TimedListSerializer
 
     def get_recipes(self, obj):
         request = self.context['request']
@@ -227,15 +417,11 @@ class SubscribeSerializer(serializers.ModelSerializer):
         if request:
             recipes_limit = request.query_params.get('recipes_limit')
         recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = obj.recipes.all()[: int(recipes_limit)]
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[: int(recipes_limit)]
         return RecipeSmallSerializer(
             recipes, many=True, context={'request': request}
         ).data
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        return request.user.subscriber.exists()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.id in get_subscriptions(self.context)
@@ -0,0 +1,48 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.db import check_connections
+from foodgram.middleware import install_query_recorder
+from recipes.changes import recipes_changed
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.versions import tags_version
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_recipes_cache(**kwargs):
+    recipes_changed()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes_cache_for_tags(action, **kwargs):
+    if action.startswith('post_'):
+        recipes_changed()
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipes_cache_for_author(created, update_fields=None,
+                                        **kwargs):
+    if not created and (
+        update_fields is None or set(update_fields) - {'last_login'}
+    ):
+        recipes_changed()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    transaction.on_commit(tags_version.bump)
+
+
+@receiver(request_started)
+def check_database_connections(**kwargs):
+    check_connections()
+
+
+@receiver(connection_created)
+def install_database_query_recorder(connection, **kwargs):
+    install_query_recorder(connection)
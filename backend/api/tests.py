@@ -0,0 +1,1023 @@
+import asyncio
+import os
+import re
+from base64 import b64encode
+from contextlib import redirect_stdout, suppress
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+from unittest import mock, skipUnless
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Exists, F, OuterRef
+from django.test import (AsyncClient, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from foodgram.db import check_connections
+from foodgram.streaming import StreamingASGIHandler
+from recipes.models import (DataVersion, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.matching import ingredient_set_index
+from recipes.recommendations import build
+from recipes.search import search_index
+from recipes.timeline import fan_out
+from recipes.versions import ingredients_version
+from users.models import Subscribe, User
+from .async_views import async_read
+from .pagination import RecipePagination
+from .readers import recipe_reader
+from .renderers import ORJSONRenderer
+from .serializers import RecipesSerializer
+from .views import annotate_flags
+
+
+class RecipeListQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {i}',
+                text='Текст',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            recipe.tags.set(tags[:i % 3 + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients[:i % 5 + 1]
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_list(self, page_size):
+        with mock.patch.object(RecipePagination, 'page_size', page_size):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), page_size)
+        return response
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(5):
+                    self.get_list(page_size)
+
+    def test_flags(self):
+        results = self.get_list(10).json()['results']
+        favorited = set(Favorite.objects.values_list('recipe_id', flat=True))
+        in_cart = set(ShoppingCart.objects.values_list('recipe_id', flat=True))
+        for recipe in results:
+            self.assertEqual(recipe['is_favorited'], recipe['id'] in favorited)
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in in_cart
+            )
+
+
+class ManyAuthorsQueriesTest(TestCase):
+    authors = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='viewer', email='viewer@example.com', password='password'
+        )
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        for i in range(cls.authors):
+            author = User.objects.create_user(
+                username=f'author{i}',
+                email=f'author{i}@example.com',
+                password='password',
+            )
+            if i % 2:
+                Subscribe.objects.create(user=cls.user, author=author)
+            for j in range(2):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f'Рецепт {i}-{j}',
+                    text='Текст',
+                    cooking_time=10,
+                    image='recipes/images/recipe.png',
+                )
+                recipe.tags.set([tag])
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, page_size):
+        with mock.patch.object(PageNumberPagination, 'page_size', page_size):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), page_size)
+        return response.json()['results']
+
+    def assert_flat(self, url, queries):
+        for page_size in (2, 6):
+            with self.subTest(url=url, page_size=page_size):
+                with self.assertNumQueries(queries):
+                    self.get(url, page_size)
+
+    def test_user_list(self):
+        self.assert_flat('/api/users/', 3)
+
+    def test_subscriptions(self):
+        self.assert_flat('/api/users/subscriptions/', 4)
+
+    def test_recipe_list(self):
+        self.assert_flat('/api/recipes/', 5)
+
+    def test_is_subscribed(self):
+        following = set(self.user.subscribe.values_list(
+            'author_id', flat=True
+        ))
+        for user in self.get('/api/users/', 6):
+            self.assertEqual(user['is_subscribed'], user['id'] in following)
+        for recipe in self.get('/api/recipes/', 6):
+            author = recipe['author']
+            self.assertEqual(
+                author['is_subscribed'], author['id'] in following
+            )
+
+
+class ShoppingListETagTest(TestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        cls.recipes = []
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {i}',
+                text='Текст',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=100
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def get_etag(self):
+        response = self.download()
+        self.read(response)
+        return response['ETag']
+
+    def toggle(self, method, recipe):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertLess(response.status_code, 300)
+
+    def test_not_modified(self):
+        self.toggle('post', self.recipes[0])
+        response = self.download()
+        self.assertEqual(self.read(response), 'Мука - 100 г\n')
+        with self.assertNumQueries(1):
+            response = self.download(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_content(self):
+        etags = [self.get_etag()]
+        self.toggle('post', self.recipes[0])
+        etags.append(self.get_etag())
+        self.toggle('post', self.recipes[1])
+        etags.append(self.get_etag())
+        self.toggle('delete', self.recipes[1])
+        etags.append(self.get_etag())
+        Ingredient.objects.filter(pk=self.ingredient.pk).update(name='Соль')
+        ingredients_version.bump()
+        response = self.download()
+        self.assertEqual(self.read(response), 'Соль - 100 г\n')
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), len(etags))
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Планы запросов проверяются только для PostgreSQL'
+)
+class QueryPlanTest(TestCase):
+    seq_scan = re.compile(r'Seq Scan on (\w+)')
+    small_tables = (Tag._meta.db_table,)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        Subscribe.objects.create(user=cls.user, author=author)
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='абрикос', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Текст',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        cls.recipe.tags.set([cls.tag])
+        IngredientRecipe.objects.create(
+            recipe=cls.recipe, ingredient=ingredient, amount=1
+        )
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCartIngredient.objects.create(
+            user=cls.user, ingredient=ingredient, amount=1
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def get_queries(self):
+        user = self.user
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        page_size = RecipePagination.page_size
+        return {
+            'recipes': recipes[:page_size],
+            'recipes_by_author': recipes.filter(author=user)[:page_size],
+            'recipes_by_tag': recipes.filter(
+                tags__slug=self.tag.slug
+            )[:page_size],
+            'recipes_favorited': recipes.filter(
+                favorites__user=user
+            )[:page_size],
+            'recipes_in_shopping_cart': recipes.filter(
+                shopping_carts__user=user
+            )[:page_size],
+            'recipes_flags': recipes.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+            )[:page_size],
+            'recipe_ingredients': IngredientRecipe.objects.filter(
+                recipe=self.recipe
+            ),
+            'subscriptions': Subscribe.objects.filter(
+                user=user
+            ).values_list('author_id', flat=True),
+            'subscribers': Subscribe.objects.filter(author=user),
+            'ingredients_by_name': Ingredient.objects.filter(
+                name__istartswith='а'
+            ),
+            'shopping_cart': ShoppingCartIngredient.objects.filter(
+                user=user
+            ),
+        }
+
+    def test_no_sequential_scans(self):
+        for name, queryset in self.get_queries().items():
+            with self.subTest(query=name):
+                tables = [
+                    table
+                    for table in self.seq_scan.findall(queryset.explain())
+                    if table not in self.small_tables
+                ]
+                self.assertEqual(tables, [])
+
+
+class RecipeUpdateWritesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(60)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        ingredient_set_index.invalidate()
+
+    def create_recipe(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f'Рецепт {size}',
+                text='Текст',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            recipe.tags.set([self.tag])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in self.ingredients[:size]
+            )
+        return recipe
+
+    def keep_first(self, recipe):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.id}/',
+                    {
+                        'ingredients': [
+                            {'id': self.ingredients[0].id, 'amount': 2}
+                        ],
+                        'tags': [self.tag.id],
+                    },
+                    format='json',
+                )
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_queries_do_not_depend_on_removed_ingredients(self):
+        small = self.keep_first(self.create_recipe(2))
+        large = self.keep_first(self.create_recipe(60))
+        self.assertEqual(len(large), len(small))
+        versions = {
+            name
+            for sql in large
+            if sql.startswith('UPDATE') and 'dataversion' in sql
+            for name in re.findall(r'"name" = \'(\w+)\'', sql)
+        }
+        self.assertEqual(versions, {'ingredient_sets', 'recipes'})
+
+    def test_ingredient_set_index_follows_update(self):
+        recipe = self.create_recipe(60)
+        ingredient_set_index.match([self.ingredients[0].id])
+        self.keep_first(recipe)
+        self.assertIn(
+            (recipe.id, 0),
+            ingredient_set_index.match([self.ingredients[0].id])
+        )
+        self.assertNotIn(
+            recipe.id,
+            [
+                recipe_id for recipe_id, _ in ingredient_set_index.match(
+                    [self.ingredients[1].id]
+                )
+            ]
+        )
+
+    def test_stale_index_is_rebuilt_in_background(self):
+        recipe = self.create_recipe(2)
+        ingredient_ids = [self.ingredients[0].id]
+        ingredient_set_index.match(ingredient_ids)
+        IngredientRecipe.objects.filter(recipe=recipe).delete()
+        DataVersion.objects.filter(name='ingredient_sets').update(
+            value=F('value') + 1
+        )
+        with override_settings(SHARED_VERSION_TTL=0), mock.patch(
+            'recipes.matching.executor'
+        ) as executor:
+            for _ in range(2):
+                self.assertEqual(
+                    ingredient_set_index.match(ingredient_ids),
+                    [(recipe.id, 1)]
+                )
+            executor.submit.assert_called_once()
+            _, index, version = executor.submit.call_args.args
+            index.rebuild(version)
+            self.assertEqual(ingredient_set_index.match(ingredient_ids), [])
+            executor.submit.assert_called_once()
+
+
+class RecommendationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                password='password',
+            )
+            for i in range(5)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0],
+                name=f'Рецепт {i}',
+                text='Текст',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for i in range(4)
+        ]
+        for user, favorites, carts in (
+            (0, (0, 1), ()),
+            (1, (0, 1), (2,)),
+            (2, (0, 2), ()),
+            (3, (0, 1), ()),
+        ):
+            for i in favorites:
+                Favorite.objects.create(
+                    user=cls.users[user], recipe=cls.recipes[i]
+                )
+            for i in carts:
+                ShoppingCart.objects.create(
+                    user=cls.users[user], recipe=cls.recipes[i]
+                )
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'recommendations.npz')
+        settings = override_settings(RECOMMENDATIONS_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[4])
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data]
+
+    def test_similar(self):
+        build()
+        first, second, third, unseen = (recipe.id for recipe in self.recipes)
+        self.assertEqual(
+            self.get_ids(f'/api/recipes/{first}/similar/'), [second, third]
+        )
+        self.assertEqual(
+            self.get_ids(f'/api/recipes/{first}/similar/?limit=1'), [second]
+        )
+        self.assertEqual(self.get_ids(f'/api/recipes/{unseen}/similar/'), [])
+
+    def test_recommended_skips_seen_recipes(self):
+        build()
+        Favorite.objects.create(user=self.users[4], recipe=self.recipes[1])
+        self.assertEqual(
+            self.get_ids('/api/users/me/recommended/'),
+            [self.recipes[0].id, self.recipes[2].id]
+        )
+
+    def test_incremental_build_matches_full_build(self):
+        build()
+        Favorite.objects.create(user=self.users[2], recipe=self.recipes[3])
+        ShoppingCart.objects.create(
+            user=self.users[4], recipe=self.recipes[3]
+        )
+        ShoppingCart.objects.create(
+            user=self.users[4], recipe=self.recipes[1]
+        )
+        build(incremental=True)
+        with np.load(self.path) as model:
+            incremental = {name: model[name] for name in model.files}
+        build()
+        with np.load(self.path) as model:
+            for name in model.files:
+                np.testing.assert_array_equal(
+                    incremental[name], model[name], err_msg=name
+                )
+
+
+class RecipeReaderConformanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password',
+            first_name='Автор',
+            last_name='"Кавычки"',
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент «{i}»', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=cls.author,
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for name, text in (
+                ('Суп "домашний"', 'Строка\u2028вторая\u2029 🍲 <b>&</b>'),
+                ('Каша', 'Текст\nс переносом\tи \\ слешем'),
+                ('Пустой', ''),
+            )
+        ]
+        recipes[0].tags.set(tags)
+        recipes[1].tags.set(tags[1:])
+        for recipe, size in zip(recipes, (3, 1, 0)):
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for i, ingredient in enumerate(ingredients[:size])
+            )
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipes[1])
+        Subscribe.objects.create(user=cls.user, author=cls.author)
+
+    def render(self, user):
+        request = Request(RequestFactory().get('/api/recipes/'))
+        request.user = user
+        context = {'request': request}
+        queryset = annotate_flags(Recipe.objects.all(), user)
+        expected = JSONRenderer().render(RecipesSerializer(
+            queryset.prefetch_related(
+                'recipe_ingredients__ingredient', 'tags', 'author'
+            ),
+            many=True,
+            context=context,
+        ).data)
+        rows = list(recipe_reader.values(queryset))
+        actual = ORJSONRenderer().render(
+            recipe_reader.build(rows, recipe_reader.load(rows, context))
+        )
+        return expected, actual
+
+    def test_reader_matches_serializer(self):
+        for user in (AnonymousUser(), self.user, self.author):
+            with self.subTest(user=str(user)):
+                expected, actual = self.render(user)
+                self.assertEqual(actual, expected)
+
+    @override_settings(ALLOWED_HOSTS=[])
+    def test_check_command_without_allowed_hosts(self):
+        with redirect_stdout(StringIO()) as output:
+            call_command('check_recipe_reader', user=self.user.pk)
+        self.assertIn('страниц с расхождениями: 0', output.getvalue())
+
+
+class RecipeCacheKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(2)
+        ]
+        recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Текст',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+        recipe.tags.set(tags)
+
+    def setUp(self):
+        caches['recipes'].clear()
+
+    def get_cache_status(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache']
+
+    def test_unknown_params_share_an_entry(self):
+        self.assertEqual(self.get_cache_status('/api/recipes/?x=1'), 'MISS')
+        self.assertEqual(self.get_cache_status('/api/recipes/?x=2'), 'HIT')
+        self.assertEqual(self.get_cache_status('/api/recipes/'), 'HIT')
+
+    def test_params_are_normalized(self):
+        self.assertEqual(
+            self.get_cache_status('/api/recipes/?tags=tag1&tags=tag0'),
+            'MISS'
+        )
+        self.assertEqual(
+            self.get_cache_status('/api/recipes/?tags=tag0&tags=tag1'),
+            'HIT'
+        )
+        self.assertEqual(self.get_cache_status('/api/recipes/?page=1'), 'MISS')
+        self.assertEqual(self.get_cache_status('/api/recipes/?page=01'), 'HIT')
+
+    def test_filters_are_part_of_the_key(self):
+        self.assertEqual(self.get_cache_status('/api/recipes/'), 'MISS')
+        self.assertEqual(
+            self.get_cache_status('/api/recipes/?tags=tag0'), 'MISS'
+        )
+        self.assertEqual(
+            self.get_cache_status('/api/recipes/?ordering=popular'), 'MISS'
+        )
+
+
+class RecipeSearchPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for name, text in (
+                ('Суп', 'Текст'),
+                ('Рагу', 'Как суп'),
+                ('Каша', 'Почти суп'),
+            )
+        ]
+
+    def setUp(self):
+        search_index.invalidate()
+
+    def test_search_keeps_rank_order_with_cursor(self):
+        cursor = b64encode(b'2100-01-01T00:00:00+00:00|0|0').decode()
+        response = self.client.get(
+            '/api/recipes/', {'search': 'суп', 'cursor': cursor}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(
+            response.data['results'][0]['id'], self.recipes[0].pk
+        )
+
+
+class RecipeCountersCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        cls.older, cls.newer = (
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {i}',
+                text='Текст',
+                cooking_time=10,
+                image='recipes/images/recipe.png',
+            )
+            for i in range(2)
+        )
+
+    def setUp(self):
+        caches['recipes'].clear()
+        self.reader = APIClient()
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def toggle(self, method):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.user_client, method)(
+                f'/api/recipes/{self.older.id}/favorite/'
+            )
+        self.assertLess(response.status_code, 300)
+
+    def get_popular(self):
+        response = self.reader.get('/api/recipes/?ordering=popular')
+        return [
+            (recipe['id'], recipe['favorites_count'])
+            for recipe in response.data['results']
+        ]
+
+    def get_detail(self):
+        response = self.reader.get(f'/api/recipes/{self.older.id}/')
+        return response.data['favorites_count'], response['ETag']
+
+    def test_cached_responses_follow_favorites(self):
+        self.assertEqual(
+            self.get_popular(), [(self.newer.id, 0), (self.older.id, 0)]
+        )
+        count, etag = self.get_detail()
+        self.assertEqual(count, 0)
+        self.toggle('post')
+        self.assertEqual(
+            self.get_popular(), [(self.older.id, 1), (self.newer.id, 0)]
+        )
+        count, new_etag = self.get_detail()
+        self.assertEqual(count, 1)
+        self.assertNotEqual(new_etag, etag)
+        self.toggle('delete')
+        self.assertEqual(
+            self.get_popular(), [(self.newer.id, 0), (self.older.id, 0)]
+        )
+        self.assertEqual(self.get_detail()[0], 0)
+
+
+class SubscriptionFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='password'
+            )
+            for name in ('user', 'author')
+        )
+        cls.older, cls.newer = (
+            cls.create_recipe(f'Рецепт {i}') for i in range(2)
+        )
+
+    @classmethod
+    def create_recipe(cls, name):
+        return Recipe.objects.create(
+            author=cls.author,
+            name=name,
+            text='Текст',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/users/{self.author.id}/subscribe/'
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def get_subscribers_count(self):
+        self.author.refresh_from_db(fields=('subscribers_count',))
+        return self.author.subscribers_count
+
+    def test_subscribe_and_unsubscribe(self):
+        self.assertEqual(self.client.post(self.url).status_code, 201)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        self.assertEqual(self.get_subscribers_count(), 1)
+        self.assertEqual(self.get_feed(), [self.newer.id, self.older.id])
+        latest = self.create_recipe('Новый рецепт')
+        fan_out(latest.id)
+        self.assertEqual(
+            self.get_feed(), [latest.id, self.newer.id, self.older.id]
+        )
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.get_subscribers_count(), 0)
+        self.assertEqual(self.get_feed(), [])
+        self.assertFalse(Subscribe.objects.exists())
+
+    def test_unsubscribe_without_subscription(self):
+        self.assertEqual(self.client.delete(self.url).status_code, 400)
+        self.assertEqual(self.get_subscribers_count(), 0)
+        self.assertFalse(Subscribe.objects.exists())
+        self.assertEqual(self.get_feed(), [])
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        cls.token = Token.objects.create(user=cls.user).key
+
+    def get_queries(self, response):
+        self.assertEqual(response.status_code, 200)
+        return int(re.search(
+            r'desc="(\d+) queries"', response['Server-Timing']
+        ).group(1))
+
+    def test_asgi_reports_queries(self):
+        for url in ('/api/users/', '/api/users/me/'):
+            with self.subTest(url=url):
+                wsgi = self.client.get(
+                    url, HTTP_AUTHORIZATION=f'Token {self.token}'
+                )
+                asgi = async_to_sync(AsyncClient().get)(
+                    url, authorization=f'Token {self.token}'
+                )
+                self.assertGreater(self.get_queries(wsgi), 0)
+                self.assertEqual(
+                    self.get_queries(asgi), self.get_queries(wsgi)
+                )
+
+
+@override_settings(DB_CONN_HEALTH_CHECKS=True, DB_CONN_HEALTH_CHECK_IDLE=30)
+class ConnectionHealthCheckTest(TestCase):
+    def check(self, connection, now):
+        with mock.patch('foodgram.db.connections') as connections, \
+                mock.patch('foodgram.db.time.monotonic', return_value=now):
+            connections.all.return_value = [connection]
+            check_connections()
+
+    def test_checks_only_idle_connections(self):
+        connection = mock.Mock(in_atomic_block=False, spec=[
+            'connection', 'in_atomic_block', 'is_usable', 'close'
+        ])
+        connection.is_usable.return_value = True
+        self.check(connection, 1000)
+        self.assertEqual(connection.is_usable.call_count, 1)
+        self.check(connection, 1020)
+        self.check(connection, 1040)
+        self.assertEqual(connection.is_usable.call_count, 1)
+        connection.is_usable.return_value = False
+        self.check(connection, 1080)
+        self.assertEqual(connection.is_usable.call_count, 2)
+        connection.close.assert_called_once_with()
+
+
+class ToggleConcurrencyTest(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name='Рецепт',
+            text='Текст',
+            cooking_time=10,
+            image='recipes/images/recipe.png',
+        )
+
+    def toggle(self, method, url, barrier, statuses):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            barrier.wait()
+            statuses.append(getattr(client, method)(url).status_code)
+        finally:
+            connection.close()
+
+    def run_parallel(self, method, url):
+        barrier = Barrier(self.threads)
+        statuses = []
+        threads = [
+            Thread(target=self.toggle, args=(method, url, barrier, statuses))
+            for _ in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_state(self, model, counter, expected):
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), expected)
+        self.assertEqual(
+            model.objects.filter(user=self.user, recipe=self.recipe).count(),
+            expected
+        )
+
+    def test_parallel_toggles(self):
+        for path, model, counter in (
+            ('favorite', Favorite, 'favorites_count'),
+            ('shopping_cart', ShoppingCart, 'shopping_carts_count'),
+        ):
+            with self.subTest(path=path):
+                url = f'/api/recipes/{self.recipe.id}/{path}/'
+                self.assertEqual(
+                    self.run_parallel('post', url),
+                    [201] + [400] * (self.threads - 1)
+                )
+                self.assert_state(model, counter, 1)
+                self.assertEqual(
+                    self.run_parallel('delete', url),
+                    [204] + [400] * (self.threads - 1)
+                )
+                self.assert_state(model, counter, 0)
+
+    def test_missing_recipe(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.id + 1}/favorite/'
+        self.assertEqual(client.post(url).status_code, 404)
+        self.assertEqual(client.delete(url).status_code, 404)
+        self.assertFalse(Favorite.objects.exists())
+
+
+class AsyncShoppingCartStreamTest(TransactionTestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        self.token = Token.objects.create(user=user).key
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(50)
+        )
+        ShoppingCartIngredient.objects.bulk_create(
+            ShoppingCartIngredient(user=user, ingredient=ingredient, amount=i)
+            for i, ingredient in enumerate(Ingredient.objects.all(), 1)
+        )
+        self.expected = b''.join(self.client.get(
+            self.url, HTTP_AUTHORIZATION=f'Token {self.token}'
+        ).streaming_content)
+        self.view = async_read(resolve(self.url).func)
+
+    async def download(self, limit=None):
+        response = await self.view(ASGIRequest({
+            'type': 'http',
+            'method': 'GET',
+            'path': self.url,
+            'query_string': b'',
+            'headers': [(b'authorization', f'Token {self.token}'.encode())],
+        }, BytesIO()))
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+            if limit is not None and len(messages) > limit:
+                raise OSError
+
+        with suppress(OSError):
+            await StreamingASGIHandler().send_response(response, send)
+        await asyncio.wait_for(response.streaming_content.task, 5)
+        return messages
+
+    @mock.patch('foodgram.streaming.STREAM_CHUNK_SIZE', 64)
+    def test_streams_shopping_list(self):
+        messages = async_to_sync(self.download)()
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertGreater(len(messages), 3)
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages[1:]),
+            self.expected
+        )
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+
+    @mock.patch('foodgram.streaming.STREAM_BUFFER', 1)
+    @mock.patch('foodgram.streaming.STREAM_CHUNK_SIZE', 64)
+    def test_client_disconnect_releases_worker(self):
+        self.assertEqual(len(async_to_sync(self.download)(limit=2)), 3)
+        messages = async_to_sync(self.download)()
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages[1:]),
+            self.expected
+        )
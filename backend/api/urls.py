@@ -1,6 +1,8 @@
 from rest_framework import routers
+from django.conf import settings
 from django.urls import include, path
 
+from .async_views import async_read_urls
 from .views import (
     CustomUsersViewSet,
     TagsViewSet,
@@ -17,9 +19,12 @@ router.register('ingredients', IngredientsViewSet, basename='ingredients')
 router.register('users', CustomUsersViewSet, basename='users')
 router.register('recipes', RecipesViewSet, basename='recipes')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,23 +1,43 @@
+import hashlib
+from datetime import datetime, timezone
+from itertools import chain
+
 from rest_framework import status, viewsets, exceptions
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db.models import (BooleanField, Count, Exists, Max, OuterRef,
+                              Prefetch, Subquery, Value, Window)
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from foodgram.db import is_pinned, pin_to_primary, replica_reads
 from users.models import User, Subscribe
+from recipes.autocomplete import ingredient_index
+from recipes.counters import change_counter, increment_counter
+from recipes.matching import ingredient_set_index
+from recipes.recommendations import recommender
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     Favorite,
     ShoppingCart,
-    IngredientRecipe,
+    ShoppingCartIngredient,
+    TimelineEntry,
 )
+from recipes.shopping_cart import add_recipe, remove_recipe
+from recipes.timeline import backfill, prune
+from recipes.versions import ingredients_version
 from .serializers import (
     TagsSerializer,
     IngredientsSerializer,
@@ -27,11 +47,105 @@ from .serializers import (
     CustomUserSerializer,
     SubscribeSerializer
 )
+from .cache import conditional, ingredients_etag, recipes_cache, tags_etag
 from .filters import IngredientFilter, RecipeFilter
+from .pagination import RecipePagination, TimelineCursorPagination
 from .permissions import IsAdminAuthorOrReadOnly
+from .readers import recipe_reader
+from .renderers import (
+    ORJSONRenderer,
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartTextRenderer,
+)
+
+SHOPPING_CART_CHUNK_SIZE = 500
+
 
+def annotate_flags(queryset, user):
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_favorited=Value(False, output_field=BooleanField()),
+            is_in_shopping_cart=Value(False, output_field=BooleanField()),
+        )
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+        is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('pk'))),
+    )
 
-class CustomUsersViewSet(UserViewSet):
+
+def get_limit(request):
+    limit = request.query_params.get('limit')
+    if limit is None:
+        return settings.RECOMMENDATIONS_LIMIT
+    if not limit.isdigit():
+        raise exceptions.ValidationError(
+            detail='Параметр limit должен быть целым числом.'
+        )
+    return min(int(limit), settings.RECOMMENDATIONS_NEIGHBORS)
+
+
+def serialize_recipes(view, recipe_ids):
+    recipes = {
+        row['id']: row for row in recipe_reader.values(annotate_flags(
+            Recipe.objects.filter(pk__in=recipe_ids), view.request.user
+        ))
+    }
+    return recipe_reader.read(
+        [recipes[pk] for pk in recipe_ids if pk in recipes],
+        view.get_serializer_context()
+    )
+
+
+def insert_if_absent(model, **values):
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(name).column) for name in values
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} ({columns}) VALUES ({values}) '
+            'ON CONFLICT DO NOTHING RETURNING 1'.format(
+                table=quote_name(model._meta.db_table),
+                columns=columns,
+                values=', '.join(['%s'] * len(values)),
+            ),
+            list(values.values())
+        )
+        return cursor.fetchone() is not None
+
+
+class PrimaryPinMixin:
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaReadMixin(PrimaryPinMixin):
+    replica_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request.user):
+            self.replica_token = replica_reads.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.replica_token is not None:
+                replica_reads.reset(self.replica_token)
+                self.replica_token = None
+
+
+class CustomUsersViewSet(PrimaryPinMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -44,14 +158,44 @@ class CustomUsersViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'renditions', 'cooking_time', 'author_id'
+        )
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).values('pk')[:int(recipes_limit)]
+            ))
+        queryset = User.objects.filter(
+            subscriber__user=request.user
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        ).order_by('username')
         serializer = SubscribeSerializer(
-            self.paginate_queryset(User.objects.filter(
-                subscriber__user=self.request.user)),
-            context={'request': request},
+            self.paginate_queryset(queryset),
+            context=self.get_serializer_context(),
             many=True
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='me/recommended',
+        url_name='recommended',
+        permission_classes=(IsAuthenticated,),
+    )
+    def recommended(self, request):
+        user = request.user
+        seen = set(
+            user.favorites.values_list('recipe_id', flat=True)
+        ).union(user.shopping_carts.values_list('recipe_id', flat=True))
+        return Response(serialize_recipes(
+            self, recommender.recommend(seen, get_limit(request))
+        ))
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -59,42 +203,82 @@ class CustomUsersViewSet(UserViewSet):
         url_name='subscribe',
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def subscribe(self, request, **kwargs):
         author = get_object_or_404(User, id=self.kwargs.get('id'))
-        subscription, created = Subscribe.objects.get_or_create(
+        if request.method == 'DELETE':
+            deleted, _ = Subscribe.objects.filter(
+                user=request.user,
+                author=author
+            ).delete()
+            if not deleted:
+                raise exceptions.ValidationError(
+                    detail='У вас нет подписки на данного пользователя.'
+                )
+            change_counter(User, 'subscribers_count', author.id, -1)
+            prune(request.user.id, author.id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        _, created = Subscribe.objects.get_or_create(
             user=request.user,
             author=author
         )
-        if request.method == 'POST' and not created:
+        if not created:
             raise exceptions.ValidationError(
                 detail='У вас уже есть подписка на данного пользователя.'
             )
-        if request.method == 'POST':
-            serializer = SubscribeSerializer(
-                author,
-                context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        change_counter(User, 'subscribers_count', author.id)
+        backfill(request.user.id, author.id)
+        serializer = SubscribeSerializer(
+            author,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class CatalogViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    catalog_etag = None
+    pagination_class = None
+
+    def conditional(self, request, handler, *args, **kwargs):
+        return conditional(
+            request,
+            handler,
+            *args,
+            etag=self.catalog_etag.get(request),
+            **kwargs
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(request, super().list, *args, **kwargs)
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(request, super().retrieve, *args, **kwargs)
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientsViewSet(CatalogViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
-    pagination_class = None
+    catalog_etag = ingredients_etag
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return self.conditional(request, self.search, name)
+        return super().list(request, *args, **kwargs)
 
+    def search(self, request, name):
+        return Response(ingredient_index.search(name))
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagsViewSet(CatalogViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
-    pagination_class = None
+    catalog_etag = tags_etag
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipesSerializer
     permission_classes = (
@@ -103,6 +287,9 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    renderer_classes = (ORJSONRenderer, BrowsableAPIRenderer)
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
         queryset = Recipe.objects.prefetch_related(
@@ -110,34 +297,204 @@ class RecipesViewSet(viewsets.ModelViewSet):
             'tags',
             'author'
         ).all()
-        return queryset
+        return annotate_flags(queryset, self.request.user)
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeUpdateCreateSerializer
         return RecipesSerializer
 
+    def list(self, request, *args, **kwargs):
+        return recipes_cache.fetch(
+            request, self, self.read_list, *args, **kwargs
+        )
+
+    def read_list(self, request, *args, **kwargs):
+        queryset = recipe_reader.values(self.filter_queryset(
+            annotate_flags(Recipe.objects.all(), request.user)
+        ))
+        page = self.paginate_queryset(queryset)
+        data = recipe_reader.read(page, self.get_serializer_context())
+        return self.get_paginated_response(data)
+
+    def read_detail(self, request, *args, **kwargs):
+        data = serialize_recipes(self, [int(kwargs['pk'])])
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    def retrieve(self, request, *args, **kwargs):
+        state = annotate_flags(
+            Recipe.objects.filter(pk=kwargs.get('pk')), request.user
+        ).annotate(
+            is_subscribed=Exists(Subscribe.objects.filter(
+                user_id=request.user.id, author=OuterRef('author')))
+        ).values(
+            'updated_at',
+            'favorites_count',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'is_subscribed',
+            'author__email',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+        ).first()
+        if state is None:
+            raise Http404
+        generation = recipes_cache.get_generation()
+        etag = '"{}-{}"'.format(
+            hashlib.md5(
+                repr((generation, sorted(state.items()))).encode()
+            ).hexdigest(),
+            request.accepted_renderer.format,
+        )
+        last_modified = None
+        if request.user.is_anonymous:
+            last_modified = max(
+                state['updated_at'],
+                datetime.fromtimestamp(generation / 1e9, timezone.utc),
+            )
+        return conditional(
+            request,
+            recipes_cache.fetch,
+            self,
+            self.read_detail,
+            *args,
+            etag=etag,
+            last_modified=last_modified,
+            **kwargs
+        )
+
     @action(
         detail=True,
-        methods=['POST', 'DELETE'],
-        url_path='favorite',
-        url_name='favorite',
+        methods=['GET'],
+        url_path='similar',
+        url_name='similar',
+    )
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        return Response(serialize_recipes(
+            self, recommender.similar(recipe.id, get_limit(request))
+        ))
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='feed',
+        url_name='feed',
         permission_classes=(IsAuthenticated,),
     )
-    def add_remove_favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        obj, created = Favorite.objects.select_related(
-            'user', 'recipe'
-        ).get_or_create(user=request.user, recipe=recipe)
-        if request.method == 'POST' and created:
+    def feed(self, request):
+        paginator = TimelineCursorPagination()
+        page = paginator.paginate_queryset(
+            TimelineEntry.objects.filter(user=request.user).values(
+                'recipe_id', 'pub_date'
+            ),
+            request,
+            self
+        )
+        return paginator.get_paginated_response(serialize_recipes(
+            self, [entry['recipe_id'] for entry in page]
+        ))
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='cookable',
+        url_name='cookable',
+    )
+    def cookable(self, request):
+        try:
+            ingredient_ids = [
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id
+            ]
+            max_missing = request.query_params.get('max_missing')
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            raise exceptions.ValidationError(
+                detail='Параметры ingredients и max_missing должны быть '
+                       'целыми числами.'
+            )
+        if not ingredient_ids:
+            raise exceptions.ValidationError(
+                detail='Укажите хотя бы один ингредиент.'
+            )
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(
+            ingredient_set_index.match(ingredient_ids, max_missing),
+            request,
+            view=self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], missing) for recipe_id, missing in page
+            if recipe_id in recipes
+        ]
+        data = self.get_serializer(
+            [recipe for recipe, _ in page], many=True
+        ).data
+        for item, (_, missing) in zip(data, page):
+            item['missing_ingredients'] = missing
+        return paginator.get_paginated_response(data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='cache_stats',
+        url_name='cache_stats',
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        return Response(recipes_cache.stats())
+
+    def add_remove(self, request, pk, model, counter, errors):
+        if request.method == 'POST':
+            try:
+                inserted = insert_if_absent(
+                    model, user_id=request.user.id, recipe_id=pk
+                )
+            except IntegrityError:
+                raise Http404
+            if not inserted:
+                raise exceptions.ValidationError(detail=errors['POST'])
+            recipe = increment_counter(
+                Recipe, counter, pk, RecipeSmallSerializer.Meta.fields
+            )
+            if recipe is None:
+                raise Http404
             serializer = RecipeSmallSerializer(
                 recipe,
                 context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE' and obj:
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk
+        ).delete()
+        if not deleted:
+            get_object_or_404(Recipe, pk=pk)
+            raise exceptions.ValidationError(detail=errors['DELETE'])
+        change_counter(Recipe, counter, pk, -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=True,
+        methods=['POST', 'DELETE'],
+        url_path='favorite',
+        url_name='favorite',
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def add_remove_favorite(self, request, pk):
+        return self.add_remove(request, pk, Favorite, 'favorites_count', {
+            'POST': 'Рецепт уже есть в избранном.',
+            'DELETE': 'Рецепта нет в избранном.',
+        })
 
     @action(
         detail=True,
@@ -146,20 +503,19 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_name='shopping_cart',
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def add_remove_shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        obj, created = ShoppingCart.objects.select_related(
-            'user', 'recipe'
-        ).get_or_create(user=request.user, recipe=recipe)
-        if request.method == 'POST' and created:
-            serializer = RecipeSmallSerializer(
-                recipe,
-                context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE' and obj:
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        response = self.add_remove(
+            request, pk, ShoppingCart, 'shopping_carts_count', {
+                'POST': 'Рецепт уже есть в списке покупок.',
+                'DELETE': 'Рецепта нет в списке покупок.',
+            }
+        )
+        if request.method == 'POST':
+            add_recipe(request.user.id, int(pk))
+        else:
+            remove_recipe(request.user.id, int(pk))
+        return response
 
     @action(
         detail=False,
@@ -167,19 +523,49 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingCartTextRenderer,
+            ShoppingCartCSVRenderer,
+            ShoppingCartJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        ingredients = (IngredientRecipe.objects.filter(
-            recipe__shopping_carts__user=request.user).values(
+        renderer = request.accepted_renderer
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
+        ).annotate(
+            rows=Window(Count('pk')),
+            changed=Window(Max('updated_at')),
+        ).order_by(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(amount=Sum('amount')))
-        pretty_ings = []
-        for ingredient in ingredients:
-            pretty_ings.append('{name} - {amount} {m_unit}\n'.format(
-                name=ingredient.get('ingredient__name'),
-                amount=ingredient.get('amount'),
-                m_unit=ingredient.get('ingredient__measurement_unit')
-            ))
-        response = FileResponse(pretty_ings, content_type='text/plain')
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+            'rows',
+            'changed',
+        ).iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        first = next(ingredients, None)
+        etag = '"{}"'.format(hashlib.md5(repr((
+            renderer.format,
+            ingredients_version.get(),
+            first and (first['rows'], first['changed']),
+        )).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            ingredients.close()
+            return response
+        if first is not None:
+            ingredients = chain((first,), ingredients)
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type='{}; charset={}'.format(
+                renderer.media_type, renderer.charset
+            ),
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            'attachment; filename="shopping_list.{}"'.format(renderer.format)
+        )
         return response
@@ -0,0 +1,57 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def check_connections():
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle = now - getattr(connection, 'last_used_at', 0)
+        connection.last_used_at = now
+        if (
+            idle >= settings.DB_CONN_HEALTH_CHECK_IDLE
+            and not connection.is_usable()
+        ):
+            connection.close()
+
+
+def get_pin_key(user):
+    return f'db-primary-pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    caches[settings.DB_PRIMARY_PIN_CACHE].set(
+        get_pin_key(user), True, settings.DB_PRIMARY_PIN_SECONDS
+    )
+
+
+def is_pinned(user):
+    return user.is_authenticated and caches[
+        settings.DB_PRIMARY_PIN_CACHE
+    ].get(get_pin_key(user), False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DB_REPLICAS and replica_reads.get():
+            return random.choice(settings.DB_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,172 @@
+import json
+import logging
+import random
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('foodgram.metrics')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+current_queries = ContextVar('current_queries', default=None)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.count += 1
+            self.shapes[IN_LIST.sub('IN (...)', sql)] += 1
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = QueryRecorder()
+        self.render_started = None
+        self.render_duration = 0
+        self.serializing = False
+        self.serialize_duration = 0
+
+    def render_finished(self, response):
+        self.render_duration = perf_counter() - self.render_started
+
+
+def record_query(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def record_queries(request):
+    metrics = getattr(request, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    for connection in connections.all():
+        install_query_recorder(connection)
+    token = current_queries.set(metrics.queries)
+    try:
+        yield
+    finally:
+        current_queries.reset(token)
+
+
+@contextmanager
+def track_serialization(request):
+    metrics = getattr(request, 'metrics', None)
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = perf_counter()
+    db_started = metrics.queries.duration
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_duration += (
+            perf_counter() - started
+            - (metrics.queries.duration - db_started)
+        )
+
+
+def track_render(request, response):
+    metrics = getattr(request, 'metrics', None)
+    if metrics is not None and not response.is_rendered:
+        metrics.render_started = perf_counter()
+        response.add_post_render_callback(metrics.render_finished)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.repeat_limit = settings.REQUEST_METRICS_REPEAT_LIMIT
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        request.metrics = RequestMetrics()
+        started = perf_counter()
+        with record_queries(request):
+            response = self.get_response(request)
+        return self.report(request, response, perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        request.metrics = RequestMetrics()
+        started = perf_counter()
+        with record_queries(request):
+            response = await self.get_response(request)
+        return self.report(request, response, perf_counter() - started)
+
+    def report(self, request, response, total):
+        metrics = request.metrics
+        queries = metrics.queries
+        response['Server-Timing'] = (
+            'db;dur={db:.2f};desc="{count} queries", '
+            'serialize;dur={serialize:.2f}, render;dur={render:.2f}, '
+            'total;dur={total:.2f}'.format(
+                db=queries.duration * 1000,
+                count=queries.count,
+                serialize=metrics.serialize_duration * 1000,
+                render=metrics.render_duration * 1000,
+                total=total * 1000,
+            )
+        )
+        repeated = {
+            shape: count for shape, count in queries.shapes.items()
+            if count > self.repeat_limit
+        }
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 2),
+            'serialize_ms': round(metrics.serialize_duration * 1000, 2),
+            'render_ms': round(metrics.render_duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'size': None if response.streaming else len(response.content),
+        }
+        if repeated:
+            record['repeated_queries'] = repeated
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        track_render(request, response)
+        return response
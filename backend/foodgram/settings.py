@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,6 +41,33 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'foodgram.urls'
 
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', 10))
+
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.getenv('REQUEST_METRICS_SAMPLE_RATE', 0.1)
+)
+REQUEST_METRICS_REPEAT_LIMIT = int(
+    os.getenv('REQUEST_METRICS_REPEAT_LIMIT', 5)
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -65,10 +93,31 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+DB_CONN_HEALTH_CHECKS = (
+    os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+)
+DB_CONN_HEALTH_CHECK_IDLE = int(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', 30))
+
+DB_REPLICAS = []
+for index, address in enumerate(os.getenv('DB_REPLICA_HOSTS', '').split()):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['foodgram.db.PrimaryReplicaRouter']
+DB_PRIMARY_PIN_SECONDS = int(os.getenv('DB_PRIMARY_PIN_SECONDS', 5))
+DB_PRIMARY_PIN_CACHE = os.getenv('DB_PRIMARY_PIN_CACHE', 'default')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,6 +149,18 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', 4096)
+)
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (300, 300),
+    'medium': (800, 800),
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -115,6 +176,44 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+RECIPES_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': RECIPES_CACHE_BACKENDS[
+            os.getenv('RECIPES_CACHE_BACKEND', 'locmem')
+        ],
+        'LOCATION': os.getenv(
+            'RECIPES_CACHE_LOCATION', BASE_DIR / 'cache' / 'recipes'
+        ),
+        'TIMEOUT': int(os.getenv('RECIPES_CACHE_TIMEOUT', 300)),
+    },
+}
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+SHARED_VERSION_TTL = float(os.getenv('SHARED_VERSION_TTL', 1))
+
+INGREDIENTS_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENTS_AUTOCOMPLETE_LIMIT', 50)
+)
+
+TIMELINE_LIMIT = int(os.getenv('TIMELINE_LIMIT', 500))
+TIMELINE_BATCH_SIZE = int(os.getenv('TIMELINE_BATCH_SIZE', 1000))
+TIMELINE_WORKERS = int(os.getenv('TIMELINE_WORKERS', 2))
+
+RECOMMENDATIONS_PATH = os.getenv(
+    'RECOMMENDATIONS_PATH', BASE_DIR / 'data' / 'recommendations.npz'
+)
+RECOMMENDATIONS_NEIGHBORS = int(os.getenv('RECOMMENDATIONS_NEIGHBORS', 50))
+RECOMMENDATIONS_LIMIT = int(os.getenv('RECOMMENDATIONS_LIMIT', 20))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
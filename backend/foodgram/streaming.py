@@ -0,0 +1,158 @@
+import asyncio
+from concurrent import futures
+from threading import Event
+
+import django
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.http import StreamingHttpResponse
+
+STREAM_BUFFER = 8
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_TIMEOUT = 60
+
+END = object()
+
+
+class ThreadStream:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(STREAM_BUFFER)
+        self.response = loop.create_future()
+        self.closed = Event()
+
+    def respond(self, response):
+        self.loop.call_soon_threadsafe(self.response.set_result, response)
+
+    def fail(self, error):
+        self.loop.call_soon_threadsafe(self.response.set_exception, error)
+
+    def put(self, item):
+        if self.closed.is_set():
+            return False
+        future = asyncio.run_coroutine_threadsafe(
+            self.queue.put(item), self.loop
+        )
+        try:
+            future.result(STREAM_TIMEOUT)
+        except futures.TimeoutError:
+            future.cancel()
+            self.closed.set()
+            return False
+        return True
+
+    def serve(self, get_response):
+        try:
+            response = get_response()
+        except Exception as error:
+            self.fail(error)
+            return
+        if not response.streaming:
+            self.respond(response)
+            return
+        self.respond(AsyncStreamingHttpResponse.from_response(response, self))
+        self.feed(response)
+
+    def feed(self, response):
+        chunks = []
+        size = 0
+        try:
+            for chunk in response:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_SIZE:
+                    if not self.put(b''.join(chunks)):
+                        return
+                    chunks = []
+                    size = 0
+            if chunks and not self.put(b''.join(chunks)):
+                return
+            self.put(END)
+        except Exception as error:
+            self.put(error)
+        finally:
+            response.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def __iter__(self):
+        get_next = async_to_sync(self.__anext__)
+        while True:
+            try:
+                yield get_next()
+            except StopAsyncIteration:
+                return
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def close(self):
+        self.closed.set()
+        self.loop.call_soon_threadsafe(self.drain)
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    @property
+    def streaming_content(self):
+        return self._iterator
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._iterator = value
+        if hasattr(value, 'close'):
+            self._resource_closers.append(value.close)
+
+    @classmethod
+    def from_response(cls, response, stream):
+        streaming = cls(stream, status=response.status_code)
+        streaming.headers = response.headers
+        streaming.cookies = response.cookies
+        return streaming
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not isinstance(response, AsyncStreamingHttpResponse):
+            return await super().send_response(response, send)
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        try:
+            async for part in response.streaming_content:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
@@ -1,16 +1,39 @@
 from django.contrib import admin
+
+from .changes import recipes_changed
 from .models import (
     Ingredient,
     Tag,
     Recipe,
     IngredientRecipe,
     Favorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingCartIngredient,
+    TimelineEntry,
 )
 
+
+class IngredientRecipeAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        recipes_changed(recipe_ids, search=True, ingredients=True)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recipes_changed([obj.recipe_id], search=True, ingredients=True)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recipes_changed(recipe_ids, search=True, ingredients=True)
+
+
 admin.site.register(Recipe)
 admin.site.register(Tag)
 admin.site.register(Ingredient)
-admin.site.register(IngredientRecipe)
+admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
+admin.site.register(ShoppingCartIngredient)
+admin.site.register(TimelineEntry)
@@ -0,0 +1,53 @@
+import heapq
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from .models import Ingredient
+from .versions import ingredients_version
+
+PREFIX_END = chr(0x10FFFF)
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = None
+        self._rows = None
+        self._version = None
+
+    def _build(self):
+        rows = sorted(
+            (name.casefold(), id, name, measurement_unit)
+            for id, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        self._rows = rows
+        self._keys = [row[0] for row in rows]
+
+    def search(self, prefix, limit=None):
+        if limit is None:
+            limit = settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+        version = ingredients_version.get()
+        with self._lock:
+            if self._keys is None or self._version != version:
+                self._build()
+                self._version = version
+            keys, rows = self._keys, self._rows
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + PREFIX_END, start)
+        matches = heapq.nsmallest(
+            limit,
+            rows[start:end],
+            key=lambda row: (row[0] != prefix, len(row[0]), row[0], row[1])
+        )
+        return [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for _, id, name, measurement_unit in matches
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,51 @@
+from django.db import transaction
+
+from .matching import ingredient_set_index
+from .search import update_search_vectors
+from .versions import recipes_version
+
+
+class RecipeChanges:
+    def __init__(self):
+        self.search_ids = set()
+        self.ingredient_ids = set()
+        self.done = False
+
+    def add(self, recipe_ids, search, ingredients):
+        if search:
+            self.search_ids.update(recipe_ids)
+        if ingredients:
+            self.ingredient_ids.update(recipe_ids)
+
+    def __call__(self):
+        self.done = True
+        recipes_version.bump()
+        if self.search_ids:
+            update_search_vectors(self.search_ids)
+        if self.ingredient_ids:
+            ingredient_set_index.update(self.ingredient_ids)
+
+
+def get_pending(connection):
+    savepoint_ids = set(connection.savepoint_ids)
+    for callback_savepoint_ids, callback in connection.run_on_commit:
+        if (
+            isinstance(callback, RecipeChanges)
+            and not callback.done
+            and callback_savepoint_ids == savepoint_ids
+        ):
+            return callback
+    changes = RecipeChanges()
+    transaction.on_commit(changes, using=connection.alias)
+    return changes
+
+
+def recipes_changed(recipe_ids=(), search=False, ingredients=False,
+                    using=None):
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        changes = RecipeChanges()
+        changes.add(recipe_ids, search, ingredients)
+        changes()
+        return
+    get_pending(connection).add(recipe_ids, search, ingredients)
@@ -0,0 +1,98 @@
+from django.db import connection, router, transaction
+from django.db.models import (Case, Count, F, IntegerField, OuterRef,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribe, User
+from .changes import recipes_changed
+from .models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = {
+    (Recipe, 'favorites_count'): (Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count'): (ShoppingCart, 'recipe'),
+    (User, 'recipes_count'): (Recipe, 'author'),
+    (User, 'subscribers_count'): (Subscribe, 'author'),
+}
+CACHED_COUNTERS = {
+    (Recipe, 'favorites_count'),
+}
+
+
+def counter_changed(model, field):
+    if (model, field) in CACHED_COUNTERS:
+        recipes_changed()
+
+
+def change_counter(model, field, pk, delta=1):
+    if model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    ):
+        counter_changed(model, field)
+
+
+def increment_counter(model, field, pk, fields):
+    quote_name = connection.ops.quote_name
+    opts = model._meta
+    column = quote_name(opts.get_field(field).column)
+    instance = next(iter(model.objects.raw(
+        'UPDATE {table} SET {column} = {column} + 1 WHERE {pk} = %s '
+        'RETURNING {fields}'.format(
+            table=quote_name(opts.db_table),
+            column=column,
+            pk=quote_name(opts.pk.column),
+            fields=', '.join(
+                quote_name(opts.get_field(name).column) for name in fields
+            ),
+        ),
+        [pk],
+        using=router.db_for_write(model),
+    )), None)
+    if instance is not None:
+        counter_changed(model, field)
+    return instance
+
+
+def change_counters(model, field, deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    model.objects.filter(pk__in=deltas).update(**{field: Greatest(
+        F(field) + Case(
+            *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+            output_field=IntegerField(),
+        ),
+        0,
+    )})
+    counter_changed(model, field)
+
+
+def expected_count(model, field):
+    source, related = COUNTERS[model, field]
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{related: OuterRef('pk')}
+        ).order_by().values(related).annotate(
+            count=Count('pk')
+        ).values('count'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def drifted(model, field):
+    return model.objects.annotate(
+        expected=expected_count(model, field)
+    ).exclude(**{field: F('expected')})
+
+
+@transaction.atomic
+def reconcile(verify=False):
+    drift = {}
+    for model, field in COUNTERS:
+        pks = list(drifted(model, field).values_list('pk', flat=True))
+        drift[f'{model._meta.model_name}.{field}'] = len(pks)
+        if pks and not verify:
+            model.objects.filter(pk__in=pks).update(
+                **{field: expected_count(model, field)}
+            )
+            counter_changed(model, field)
+    return drift
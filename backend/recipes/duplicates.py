@@ -0,0 +1,81 @@
+from .models import Ingredient, IngredientRecipe, ShoppingCartIngredient
+
+
+def get_duplicates(cursor, quote_name):
+    table = quote_name(Ingredient._meta.db_table)
+    cursor.execute(
+        'SELECT name, measurement_unit, MIN(id) FROM {table} '
+        'GROUP BY name, measurement_unit HAVING COUNT(*) > 1'.format(
+            table=table
+        )
+    )
+    duplicates = {}
+    for name, measurement_unit, survivor in cursor.fetchall():
+        cursor.execute(
+            'SELECT id FROM {table} WHERE name = %s '
+            'AND measurement_unit = %s AND id <> %s'.format(table=table),
+            [name, measurement_unit, survivor]
+        )
+        duplicates[survivor] = [row[0] for row in cursor.fetchall()]
+    return duplicates
+
+
+def merge_rows(cursor, table, owner, survivor, ingredient_ids):
+    placeholders = ', '.join(['%s'] * len(ingredient_ids))
+    cursor.execute(
+        'SELECT MIN(id), SUM(amount) FROM {table} '
+        'WHERE ingredient_id IN ({placeholders}) GROUP BY {owner}'.format(
+            table=table, placeholders=placeholders, owner=owner
+        ),
+        ingredient_ids
+    )
+    kept = cursor.fetchall()
+    cursor.execute(
+        'DELETE FROM {table} WHERE ingredient_id IN ({placeholders}) '
+        'AND id NOT IN (SELECT MIN(id) FROM {table} '
+        'WHERE ingredient_id IN ({placeholders}) GROUP BY {owner})'.format(
+            table=table, placeholders=placeholders, owner=owner
+        ),
+        ingredient_ids * 2
+    )
+    cursor.executemany(
+        'UPDATE {table} SET ingredient_id = %s, amount = %s '
+        'WHERE id = %s'.format(table=table),
+        [(survivor, amount, row_id) for row_id, amount in kept]
+    )
+
+
+def merge_duplicate_ingredients(connection):
+    tables = connection.introspection.table_names()
+    if Ingredient._meta.db_table not in tables:
+        return 0
+    quote_name = connection.ops.quote_name
+    related = [
+        (
+            quote_name(model._meta.db_table),
+            quote_name(model._meta.get_field(owner).column),
+        )
+        for model, owner in (
+            (IngredientRecipe, 'recipe'),
+            (ShoppingCartIngredient, 'user'),
+        )
+        if model._meta.db_table in tables
+    ]
+    merged = 0
+    with connection.cursor() as cursor:
+        for survivor, duplicates in get_duplicates(
+            cursor, quote_name
+        ).items():
+            for table, owner in related:
+                merge_rows(
+                    cursor, table, owner, survivor, [survivor, *duplicates]
+                )
+            cursor.execute(
+                'DELETE FROM {table} WHERE id IN ({placeholders})'.format(
+                    table=quote_name(Ingredient._meta.db_table),
+                    placeholders=', '.join(['%s'] * len(duplicates)),
+                ),
+                duplicates
+            )
+            merged += len(duplicates)
+    return merged
@@ -0,0 +1,77 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def save_rendition(image, name, size, format):
+    rendition = image.copy()
+    rendition.thumbnail(size)
+    if format == 'JPEG' and rendition.mode not in ('RGB', 'L'):
+        rendition = rendition.convert('RGB')
+    buffer = BytesIO()
+    rendition.save(buffer, format=format, optimize=True)
+    return default_storage.save(
+        '{}.{}'.format(name, FORMATS[format]), ContentFile(buffer.getvalue())
+    )
+
+
+def delete_renditions(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def build_renditions(recipe_id, source):
+    base, _ = os.path.splitext(os.path.basename(source))
+    with default_storage.open(source) as file, Image.open(file) as image:
+        image.load()
+        format = image.format if image.format in FORMATS else 'PNG'
+        renditions = {}
+        for label, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+            name = 'recipes/images/renditions/{}_{}'.format(base, label)
+            renditions[label] = save_rendition(image, name, size, format)
+            renditions[f'{label}_webp'] = save_rendition(
+                image, name, size, 'WEBP'
+            )
+    recipe = Recipe.objects.filter(pk=recipe_id, image=source).first()
+    if recipe is None:
+        delete_renditions(renditions.values())
+        return
+    stale = set(recipe.renditions.values()) - set(renditions.values())
+    recipe.renditions = renditions
+    recipe.save(update_fields=('renditions', 'updated_at'))
+    delete_renditions(stale)
+
+
+def process_renditions(recipe_id, source, stale=()):
+    close_old_connections()
+    try:
+        delete_renditions(stale)
+        build_renditions(recipe_id, source)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', source)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(recipe, stale=()):
+    return executor.submit(
+        process_renditions, recipe.pk, recipe.image.name, tuple(stale)
+    )
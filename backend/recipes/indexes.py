@@ -0,0 +1,26 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models import Func, Index, OrderBy
+from django.db.models.functions import Collate
+from django.db.models.indexes import IndexExpression
+
+
+class OpClass(Func):
+    template = '%(expressions)s %(name)s'
+
+    def __init__(self, expression, name):
+        super().__init__(expression, name=name)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return compiler.compile(self.get_source_expressions()[0])
+
+
+IndexExpression.register_wrappers(OrderBy, OpClass, Collate)
+
+
+class PostgresGinIndex(GinIndex):
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Index.create_sql(
+                self, model, schema_editor, using=using, **kwargs
+            )
+        return super().create_sql(model, schema_editor, using, **kwargs)
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from recipes.recommendations import build
+
+
+class Command(BaseCommand):
+    help = 'Строит матрицу совместной встречаемости рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Учесть только новые записи избранного и корзины.',
+        )
+
+    def handle(self, *args, **options):
+        items, pairs = build(incremental=options['incremental'])
+        print(f'Рекомендации построены: рецептов {items}, пар {pairs}')
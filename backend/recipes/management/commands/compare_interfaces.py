@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+MODES = {
+    'wsgi': {'ASYNC_READ_VIEWS': 'false'},
+    'asgi': {'ASYNC_READ_VIEWS': 'true'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность одного WSGI- и одного '
+        'ASGI-воркера на одинаковой смеси запросов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='Одновременных запросов к ASGI-воркеру.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Задержка каждого SQL-запроса в мс.')
+        parser.add_argument('--output', help='Файл для результатов JSON.')
+
+    def run(self, interface, options):
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            command = [
+                sys.executable,
+                os.path.join(settings.BASE_DIR, 'manage.py'),
+                'run_benchmark',
+                '--interface', interface,
+                '--requests', str(options['requests']),
+                '--seed', str(options['seed']),
+                '--db-latency', str(options['db_latency']),
+                '--output', output.name,
+            ]
+            if interface == 'asgi':
+                command += ['--concurrency', str(options['concurrency'])]
+            completed = subprocess.run(
+                command,
+                env={**os.environ, **MODES[interface]},
+                stdout=subprocess.DEVNULL,
+            )
+            if completed.returncode:
+                raise CommandError(f'Бенчмарк {interface} завершился ошибкой')
+            return json.load(output)
+
+    def handle(self, *args, **options):
+        results = {
+            interface: self.run(interface, options) for interface in MODES
+        }
+        wsgi = results['wsgi']['total']
+        asgi = results['asgi']['total']
+        results['summary'] = {
+            interface: {
+                key: results[interface]['total'][key]
+                for key in ('requests_per_second', 'errors', 'p95_ms')
+            }
+            for interface in MODES
+        }
+        results['summary']['speedup'] = (
+            asgi['requests_per_second'] / wsgi['requests_per_second']
+        )
+        report = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                file.write(report)
+        print(json.dumps(results['summary'], indent=2, ensure_ascii=False))
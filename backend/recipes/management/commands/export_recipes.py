@@ -0,0 +1,76 @@
+import json
+import sys
+
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Выгружает рецепты в формате JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одном запросе.',
+        )
+
+    def get_batches(self, batch_size):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'recipe_ingredients__ingredient'
+        ).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def serialize(self, recipe):
+        return {
+            'author': recipe.author.username,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'renditions': recipe.renditions,
+            'pub_date': recipe.pub_date.isoformat(),
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': ingredient.ingredient.name,
+                    'measurement_unit': ingredient.ingredient.measurement_unit,
+                    'amount': ingredient.amount,
+                }
+                for ingredient in recipe.recipe_ingredients.all()
+            ],
+        }
+
+    def handle(self, *args, **options):
+        output = (
+            open(options['path'], 'w', encoding='UTF-8')
+            if options['path'] else sys.stdout
+        )
+        count = 0
+        try:
+            for batch in self.get_batches(options['batch_size']):
+                output.writelines(
+                    json.dumps(self.serialize(recipe), ensure_ascii=False)
+                    + '\n'
+                    for recipe in batch
+                )
+                count += len(batch)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f'Выгружено рецептов: {count}', file=sys.stderr)
@@ -0,0 +1,176 @@
+import json
+import time
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.changes import recipes_changed
+from recipes.counters import change_counters
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Загружает рецепты из JSON Lines пачками с возобновлением.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON Lines с рецептами.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одной транзакции.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки, по умолчанию <path>.checkpoint.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать загрузку заново, игнорируя контрольную точку.',
+        )
+
+    def get_ingredients(self, records):
+        keys = {
+            (ingredient['name'], ingredient['measurement_unit'])
+            for record in records for ingredient in record['ingredients']
+        }
+        missing = keys - self.ingredients.keys()
+        if missing:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in missing
+                ),
+                ignore_conflicts=True,
+            )
+            self.ingredients.update({
+                (name, measurement_unit): id
+                for id, name, measurement_unit
+                in Ingredient.objects.filter(
+                    name__in={name for name, _ in missing}
+                ).values_list('id', 'name', 'measurement_unit')
+            })
+
+    @transaction.atomic
+    def import_batch(self, records):
+        authors = User.objects.in_bulk(
+            {record['author'] for record in records},
+            field_name='username',
+        )
+        existing = set(Recipe.objects.filter(
+            name__in={record['name'] for record in records}
+        ).values_list('name', 'text'))
+        unique = {}
+        for record in records:
+            key = record['name'], record['text']
+            if record['author'] in authors and key not in existing:
+                unique.setdefault(key, record)
+        records = list(unique.values())
+        if not records:
+            return 0
+        self.get_ingredients(records)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=authors[record['author']],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=record['image'],
+                renditions=record.get('renditions') or {},
+            )
+            for record in records
+        )
+        recipes = {
+            (recipe.name, recipe.text): recipe
+            for recipe in Recipe.objects.filter(
+                name__in={record['name'] for record in records}
+            ).only('id', 'name', 'text', 'pub_date')
+        }
+        dated = []
+        recipe_tags = []
+        recipe_ingredients = []
+        for record in records:
+            recipe = recipes[record['name'], record['text']]
+            if record.get('pub_date'):
+                recipe.pub_date = parse_datetime(record['pub_date'])
+                dated.append(recipe)
+            recipe_tags.extend(
+                Recipe.tags.through(
+                    recipe_id=recipe.id, tag_id=self.tags[slug]
+                )
+                for slug in record['tags'] if slug in self.tags
+            )
+            recipe_ingredients.extend(
+                IngredientRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=self.ingredients[
+                        ingredient['name'], ingredient['measurement_unit']
+                    ],
+                    amount=ingredient['amount'],
+                )
+                for ingredient in record['ingredients']
+            )
+        Recipe.objects.bulk_update(dated, ('pub_date',))
+        change_counters(User, 'recipes_count', Counter(
+            authors[record['author']].id for record in records
+        ))
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+        IngredientRecipe.objects.bulk_create(recipe_ingredients)
+        recipes_changed(
+            [
+                recipes[record['name'], record['text']].id
+                for record in records
+            ],
+            search=True,
+            ingredients=True,
+        )
+        return len(records)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        checkpoint = Path(
+            options['checkpoint'] or f'{path}.checkpoint'
+        )
+        done = 0
+        if checkpoint.exists() and not options['restart']:
+            done = int(checkpoint.read_text())
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): id
+            for id, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        }
+        started = time.perf_counter()
+        total = imported = 0
+        with open(path, encoding='UTF-8') as file:
+            lines = islice(file, done, None)
+            while True:
+                batch = list(islice(lines, options['batch_size']))
+                if not batch:
+                    break
+                imported += self.import_batch([
+                    json.loads(line) for line in batch if line.strip()
+                ])
+                total += len(batch)
+                checkpoint.write_text(str(done + total))
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        print(
+            'Рецепты загружены: добавлено {imported}, пропущено {skipped} '
+            'за {elapsed:.2f} с ({rate:.0f} рецептов/мин)'.format(
+                imported=imported,
+                skipped=total - imported,
+                elapsed=elapsed,
+                rate=total / elapsed * 60,
+            )
+        )
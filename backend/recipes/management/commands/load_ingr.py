@@ -1,15 +1,122 @@
 import csv
-from django.core.management import BaseCommand
+import io
+import json
+import time
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
 from recipes.models import Ingredient
+from recipes.utils import batches
+from recipes.versions import ingredients_version
+
+BATCH_SIZE = 5000
+
+
+def read_csv(path):
+    with open(path, encoding='UTF-8') as file:
+        for row in csv.reader(file):
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(path):
+    with open(path, encoding='UTF-8') as file:
+        for row in json.load(file):
+            yield row['name'], row['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
-        with open('data/ingredients.csv', encoding='UTF-8') as file:
-            for row in csv.reader(file):
-                name, measurement_unit = row
-                Ingredient.objects.create(
-                    name=name,
-                    measurement_unit=measurement_unit
+    help = 'Загружает ингредиенты из CSV или JSON без дубликатов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='data/ingredients.csv',
+            help='Файл с ингредиентами (.csv или .json).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество строк в одной пачке.',
+        )
+
+    def copy_batch(self, cursor, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        cursor.execute('TRUNCATE ingredients_import')
+        cursor.copy_expert(
+            'COPY ingredients_import (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cursor.execute(
+            'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredients_import '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'.format(
+                table=connection.ops.quote_name(Ingredient._meta.db_table)
+            )
+        )
+        return cursor.rowcount
+
+    def bulk_create_batch(self, batch):
+        before = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ),
+            ignore_conflicts=True,
+        )
+        return Ingredient.objects.count() - before
+
+    @transaction.atomic
+    def load(self, rows, batch_size):
+        total = inserted = 0
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE TEMPORARY TABLE ingredients_import '
+                    '(name varchar, measurement_unit varchar) '
+                    'ON COMMIT DROP'
                 )
-            print('Ингредиенты загружены')
+                for batch in batches(rows, batch_size):
+                    total += len(batch)
+                    inserted += self.copy_batch(cursor, batch)
+        else:
+            for batch in batches(rows, batch_size):
+                total += len(batch)
+                inserted += self.bulk_create_batch(batch)
+        return total, inserted
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        started = time.perf_counter()
+        total, inserted = self.load(reader(path), options['batch_size'])
+        if inserted:
+            ingredients_version.bump()
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        print(
+            'Ингредиенты загружены: добавлено {inserted}, пропущено '
+            '{skipped} за {elapsed:.2f} с ({rate:.0f} строк/с)'.format(
+                inserted=inserted,
+                skipped=total - inserted,
+                elapsed=elapsed,
+                rate=total / elapsed,
+            )
+        )
@@ -1,6 +1,7 @@
 from django.core.management import BaseCommand
 
 from recipes.models import Tag
+from recipes.versions import tags_version
 
 
 class Command(BaseCommand):
@@ -10,4 +11,5 @@ class Command(BaseCommand):
             {'name': 'Завтрак', 'color': '#DA15E8', 'slug': 'breakfast'},
             {'name': 'Ужин', 'color': '#D64A27', 'slug': 'supper'}]
         Tag.objects.bulk_create(Tag(**tag) for tag in data)
+        tags_version.bump()
         print('Тэги загружены')
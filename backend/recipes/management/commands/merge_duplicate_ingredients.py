@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.duplicates import get_duplicates, merge_duplicate_ingredients
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет ингредиенты с одинаковыми названием и единицей '
+        'измерения, суммируя их количество в рецептах и списках покупок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить наличие дубликатов, не изменяя данные.',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            with connection.cursor() as cursor:
+                duplicates = get_duplicates(cursor, connection.ops.quote_name)
+            count = sum(len(ids) for ids in duplicates.values())
+            self.stdout.write(f'Дубликатов ингредиентов: {count}')
+            if count:
+                raise CommandError('В базе есть дубликаты ингредиентов')
+            return
+        with transaction.atomic():
+            merged = merge_duplicate_ingredients(connection)
+        self.stdout.write(f'Объединено дубликатов ингредиентов: {merged}')
@@ -0,0 +1,23 @@
+from itertools import islice
+
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import update_search_vectors
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы рецептов.'
+
+    def handle(self, *args, **options):
+        recipe_ids = Recipe.objects.values_list('id', flat=True).iterator()
+        count = 0
+        while True:
+            batch = list(islice(recipe_ids, BATCH_SIZE))
+            if not batch:
+                break
+            update_search_vectors(batch)
+            count += len(batch)
+        print(f'Поисковые векторы пересчитаны: {count}')
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.shopping_cart import expected_amounts, rebuild, stored_amounts
+
+
+class Command(BaseCommand):
+    help = 'Проверяет и пересобирает агрегированные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    def handle(self, *args, **options):
+        expected = expected_amounts()
+        stored = stored_amounts()
+        drift = [
+            key for key in expected.keys() | stored.keys()
+            if expected[key] != stored[key]
+        ]
+        print(f'Расхождений в списках покупок: {len(drift)}')
+        if options['verify']:
+            if drift:
+                raise CommandError('Списки покупок рассинхронизированы')
+            return
+        rebuild(expected)
+        print('Списки покупок пересобраны')
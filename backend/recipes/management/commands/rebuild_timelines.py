@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from recipes.models import TimelineEntry
+from recipes.timeline import rebuild
+from users.models import Subscribe
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из подписок и рецептов.'
+
+    def handle(self, *args, **options):
+        user_ids = set(Subscribe.objects.values_list('user_id', flat=True))
+        TimelineEntry.objects.exclude(user_id__in=user_ids).delete()
+        for user_id in user_ids:
+            rebuild(user_id)
+        print(f'Ленты подписок пересобраны: {len(user_ids)}')
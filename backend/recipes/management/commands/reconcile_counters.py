@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики рецептов и пользователей с исходными таблицами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile(verify=options['verify'])
+        for counter, count in drift.items():
+            print(f'{counter}: расхождений {count}')
+        if options['verify']:
+            if any(drift.values()):
+                raise CommandError('Счётчики рассинхронизированы')
+            return
+        print('Счётчики пересчитаны')
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import accumulate
+
+from asgiref.sync import sync_to_async
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, ShoppingCart, Tag
+from users.models import User
+
+SCENARIOS = {
+    'feed': 40,
+    'tag_filter': 25,
+    'autocomplete': 25,
+    'cart_download': 10,
+}
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class Latency:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def count_rows(response):
+    if response.streaming:
+        return sum(
+            chunk.count(b'\n') for chunk in response.streaming_content
+        )
+    data = response.data if hasattr(response, 'data') else None
+    if isinstance(data, dict) and 'results' in data:
+        return len(data['results'])
+    if isinstance(data, list):
+        return len(data)
+    return 1
+
+
+def count_queries(response):
+    match = SERVER_TIMING_QUERIES.search(response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет типичную смесь запросов к API и измеряет задержки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--anonymous', type=float, default=0.5,
+                            help='Доля анонимных запросов к ленте.')
+        parser.add_argument('--pages', type=int, default=20,
+                            help='Глубина листания ленты.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для результатов JSON.')
+        parser.add_argument(
+            '--interface',
+            choices=('wsgi', 'asgi'),
+            default='wsgi',
+            help='Через какой обработчик Django отправлять запросы.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Число одновременных запросов (только для asgi).',
+        )
+        parser.add_argument(
+            '--db-latency',
+            type=float,
+            default=0,
+            help='Искусственная задержка каждого SQL-запроса в мс, '
+                 'имитирует сетевую задержку до базы.',
+        )
+
+    def sample_users(self, pks, size=200):
+        pks = list(pks)
+        return list(User.objects.filter(
+            pk__in=self.rng.sample(pks, min(size, len(pks)))
+        ).order_by('pk'))
+
+    def prepare(self):
+        self.users = self.sample_users(
+            User.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.cart_users = self.sample_users(
+            ShoppingCart.objects.order_by('user_id').values_list(
+                'user_id', flat=True
+            ).distinct()
+        )
+        self.tags = list(
+            Tag.objects.order_by('slug').values_list('slug', flat=True)
+        )
+        self.prefixes = sorted({
+            name[:2] for name in Ingredient.objects.order_by(
+                'pk'
+            ).values_list('name', flat=True)[:500]
+        })
+        if not self.users or not self.tags or not self.prefixes:
+            raise CommandError('Сначала заполните базу: seed_benchmark')
+        self.tokens = {
+            token.user_id: token.key for token in (
+                Token.objects.get_or_create(user=user)[0]
+                for user in {*self.users, *self.cart_users}
+            )
+        }
+
+    def get_headers(self, user):
+        if user is None:
+            return {}
+        return {'HTTP_AUTHORIZATION': f'Token {self.tokens[user.pk]}'}
+
+    def get_asgi_headers(self, user):
+        if user is None:
+            return {}
+        return {'authorization': f'Token {self.tokens[user.pk]}'}
+
+    def build_request(self, scenario):
+        rng = self.rng
+        if scenario == 'feed':
+            user = (
+                None if rng.random() < self.anonymous
+                else rng.choice(self.users)
+            )
+            page = rng.randint(1, self.pages)
+            return user, f'/api/recipes/?page={page}'
+        if scenario == 'tag_filter':
+            return rng.choice(self.users), '/api/recipes/?tags={}'.format(
+                rng.choice(self.tags)
+            )
+        if scenario == 'autocomplete':
+            return None, '/api/ingredients/?name={}'.format(
+                rng.choice(self.prefixes)
+            )
+        user = rng.choice(self.cart_users or self.users)
+        return user, '/api/recipes/download_shopping_cart/'
+
+    def summarize(self, samples):
+        latencies = [sample['latency'] for sample in samples]
+        queries = [
+            sample['queries'] for sample in samples
+            if sample['queries'] is not None
+        ]
+        elapsed = sum(latencies)
+        return {
+            'requests': len(samples),
+            'errors': sum(sample['status'] >= 400 for sample in samples),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_per_request': (
+                sum(queries) / len(queries) if queries else None
+            ),
+            'rows_per_second': (
+                sum(sample['rows'] for sample in samples) / elapsed
+                if elapsed else None
+            ),
+        }
+
+    def run_wsgi(self, requests):
+        client = Client()
+        samples = []
+        for scenario, user, url in requests:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url, **self.get_headers(user))
+                rows = count_rows(response)
+                latency = time.perf_counter() - started
+            samples.append((scenario, {
+                'latency': latency,
+                'queries': len(queries),
+                'rows': rows,
+                'status': response.status_code,
+            }))
+        return samples
+
+    async def run_asgi(self, requests, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(scenario, user, url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(
+                    url, **self.get_asgi_headers(user)
+                )
+                if response.streaming:
+                    rows = await sync_to_async(
+                        count_rows, thread_sensitive=False
+                    )(response)
+                else:
+                    rows = count_rows(response)
+                latency = time.perf_counter() - started
+            return scenario, {
+                'latency': latency,
+                'queries': count_queries(response),
+                'rows': rows,
+                'status': response.status_code,
+            }
+
+        return await asyncio.gather(*(
+            send(scenario, user, url) for scenario, user, url in requests
+        ))
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def handle(self, *args, **options):
+        if options['interface'] == 'wsgi' and options['concurrency'] != 1:
+            raise CommandError('WSGI-воркер обрабатывает запросы по одному')
+        self.rng = random.Random(options['seed'])
+        self.anonymous = options['anonymous']
+        self.pages = options['pages']
+        self.prepare()
+        if options['db_latency']:
+            latency = Latency(options['db_latency'] / 1000)
+            connection_created.connect(latency.install, weak=False)
+            for alias in connections:
+                latency.install(connection=connections[alias])
+        scenarios = list(SCENARIOS)
+        cum_weights = list(accumulate(SCENARIOS.values()))
+        requests = []
+        for _ in range(options['requests']):
+            scenario = self.rng.choices(scenarios, cum_weights=cum_weights)[0]
+            requests.append((scenario, *self.build_request(scenario)))
+        started = time.perf_counter()
+        if options['interface'] == 'asgi':
+            with override_settings(REQUEST_METRICS_SAMPLE_RATE=1):
+                results = asyncio.run(
+                    self.run_asgi(requests, options['concurrency'])
+                )
+        else:
+            results = self.run_wsgi(requests)
+        elapsed = time.perf_counter() - started
+        samples = defaultdict(list)
+        for scenario, sample in results:
+            samples[scenario].append(sample)
+        results = {
+            'started': datetime.now(timezone.utc).isoformat(),
+            'options': {
+                key: options[key]
+                for key in (
+                    'requests',
+                    'anonymous',
+                    'pages',
+                    'seed',
+                    'interface',
+                    'concurrency',
+                    'db_latency',
+                )
+            },
+            'scenarios': {
+                scenario: self.summarize(scenario_samples)
+                for scenario, scenario_samples in samples.items()
+            },
+            'total': self.summarize([
+                sample for scenario_samples in samples.values()
+                for sample in scenario_samples
+            ]),
+        }
+        results['total']['requests_per_second'] = len(requests) / elapsed
+        report = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                file.write(report)
+        print(report)
@@ -0,0 +1,156 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.counters import reconcile
+from recipes.shopping_cart import rebuild
+from recipes.versions import ingredient_sets_version, recipes_version
+from users.models import Subscribe, User
+
+BATCH_SIZE = 5000
+
+
+def zipf_weights(count, skew):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def sample_pairs(owners, targets, weights, per_owner, rng,
+                 exclude_self=False):
+    for owner in owners:
+        amount = min(int(rng.expovariate(1 / per_owner)), len(targets))
+        chosen = set(rng.choices(targets, weights=weights, k=amount))
+        if exclude_self:
+            chosen.discard(owner)
+        for target in chosen:
+            yield owner, target
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных тестов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=float, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--favorites', type=float, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=float, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Среднее число ингредиентов в рецепте.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench')
+
+    def bulk_create(self, model, objects):
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, BATCH_SIZE))
+            if not batch:
+                return
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        tags = list(Tag.objects.values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not tags or not ingredients:
+            raise CommandError(
+                'Сначала загрузите теги и ингредиенты: load_tags, load_ingr'
+            )
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='!',
+            )
+            for number in range(options['users'])
+        ))
+        users = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('id', flat=True))
+        rng.shuffle(users)
+        user_weights = zipf_weights(len(users), options['skew'])
+        now = timezone.now()
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=rng.choices(users, weights=user_weights)[0],
+                name=f'{prefix} рецепт {number}',
+                text=f'{prefix} описание рецепта {number}',
+                cooking_time=rng.randint(5, 180),
+                image='recipes/images/benchmark.png',
+            )
+            for number in range(options['recipes'])
+        ))
+        recipes = list(Recipe.objects.filter(
+            name__startswith=f'{prefix} рецепт '
+        ).only('id', 'pub_date'))
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = now - timedelta(minutes=number)
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date',), batch_size=BATCH_SIZE
+        )
+        recipes = [recipe.id for recipe in recipes]
+        rng.shuffle(recipes)
+        recipe_weights = zipf_weights(len(recipes), options['skew'])
+        ingredient_weights = zipf_weights(len(ingredients), options['skew'])
+        self.bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in set(rng.choices(tags, k=rng.randint(1, len(tags))))
+        ))
+        self.bulk_create(IngredientRecipe, (
+            IngredientRecipe(
+                recipe_id=recipe, ingredient_id=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe, ingredient in sample_pairs(
+                recipes, ingredients, ingredient_weights,
+                options['ingredients'], rng,
+            )
+        ))
+        self.bulk_create(Subscribe, (
+            Subscribe(user_id=user, author_id=author)
+            for user, author in sample_pairs(
+                users, users, user_weights, options['subscriptions'], rng,
+                exclude_self=True,
+            )
+        ))
+        self.bulk_create(Favorite, (
+            Favorite(user_id=user, recipe_id=recipe)
+            for user, recipe in sample_pairs(
+                users, recipes, recipe_weights, options['favorites'], rng
+            )
+        ))
+        self.bulk_create(ShoppingCart, (
+            ShoppingCart(user_id=user, recipe_id=recipe)
+            for user, recipe in sample_pairs(
+                users, recipes, recipe_weights, options['carts'], rng
+            )
+        ))
+        rebuild()
+        reconcile()
+        call_command('rebuild_search_index')
+        recipes_version.bump()
+        ingredient_sets_version.bump()
+        print(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}'
+        )
@@ -0,0 +1,118 @@
+import logging
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.db import close_old_connections
+
+from .models import IngredientRecipe
+from .versions import ingredient_sets_version
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix='ingredient-sets',
+)
+
+
+class IngredientSetIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._recipes = None
+        self._postings = None
+        self._version = None
+        self._rebuilding = None
+
+    def _load(self):
+        recipes = defaultdict(lambda: array('Q'))
+        postings = defaultdict(lambda: array('Q'))
+        for recipe_id, ingredient_id in IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).order_by('ingredient_id', 'recipe_id'):
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        return recipes, postings
+
+    def _build(self):
+        self._recipes, self._postings = self._load()
+
+    def rebuild(self, version):
+        try:
+            recipes, postings = self._load()
+            with self._lock:
+                self._recipes, self._postings = recipes, postings
+                self._version = version
+        finally:
+            with self._lock:
+                self._rebuilding = None
+
+    def invalidate(self):
+        with self._lock:
+            self._recipes = None
+            self._postings = None
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            posting = self._postings[ingredient_id]
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                del posting[position]
+
+    def _changed(self):
+        if ingredient_sets_version.bump(expected=self._version):
+            self._version = ingredient_sets_version.get()
+
+    def update(self, recipe_ids):
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].add(ingredient_id)
+        with self._lock:
+            if self._recipes is not None:
+                for recipe_id in recipe_ids:
+                    self._remove(recipe_id)
+                    ingredient_ids = sorted(ingredients.get(recipe_id, ()))
+                    if ingredient_ids:
+                        self._recipes[recipe_id] = array('Q', ingredient_ids)
+                    for ingredient_id in ingredient_ids:
+                        insort(self._postings[ingredient_id], recipe_id)
+            self._changed()
+
+    def match(self, ingredient_ids, max_missing=None):
+        version = ingredient_sets_version.get()
+        with self._lock:
+            if self._recipes is None:
+                self._build()
+                self._version = version
+            elif self._version != version and self._rebuilding is None:
+                self._rebuilding = executor.submit(
+                    rebuild_index, self, version
+                )
+            covered = Counter()
+            for ingredient_id in set(ingredient_ids):
+                covered.update(self._postings.get(ingredient_id, ()))
+            matches = [
+                (len(self._recipes[recipe_id]) - count, -count, -recipe_id)
+                for recipe_id, count in covered.items()
+            ]
+        if max_missing is not None:
+            matches = [match for match in matches if match[0] <= max_missing]
+        matches.sort()
+        return [(-recipe_id, missing) for missing, _, recipe_id in matches]
+
+
+def rebuild_index(index, version):
+    close_old_connections()
+    try:
+        index.rebuild(version)
+    except Exception:
+        logger.exception('Не удалось перестроить индекс наборов ингредиентов')
+    finally:
+        close_old_connections()
+
+
+ingredient_set_index = IngredientSetIndex()
@@ -0,0 +1,209 @@
+import os
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Favorite, ShoppingCart
+
+
+def get_interactions(favorite_id=None, cart_id=None, users=None):
+    favorites = Favorite.objects.all()
+    carts = ShoppingCart.objects.all()
+    if favorite_id is not None:
+        favorites = favorites.filter(id__lte=favorite_id)
+    if cart_id is not None:
+        carts = carts.filter(id__lte=cart_id)
+    if users is not None:
+        favorites = favorites.filter(user_id__in=users)
+        carts = carts.filter(user_id__in=users)
+    pairs = np.array(
+        list(favorites.values_list('user_id', 'recipe_id'))
+        + list(carts.values_list('user_id', 'recipe_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return np.unique(pairs, axis=0)
+
+
+def cooccurrence(interactions):
+    users, items = interactions[:, 0], interactions[:, 1]
+    if not len(users):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    ends = np.repeat(np.r_[starts[1:], len(users)], np.diff(
+        np.r_[starts, len(users)]
+    ))
+    counts = ends - np.arange(len(users)) - 1
+    left = np.repeat(np.arange(len(users)), counts)
+    right = left + 1 + (
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    )
+    return count_pairs(items[left], items[right])
+
+
+def count_pairs(first, second, weights=None):
+    pairs, inverse = np.unique(
+        np.stack((first, second), axis=1), axis=0, return_inverse=True
+    )
+    counts = np.bincount(
+        inverse.reshape(-1), weights=weights, minlength=len(pairs)
+    ).astype(np.int64)
+    keep = counts != 0
+    return pairs[keep, 0], pairs[keep, 1], counts[keep]
+
+
+def count_items(items, weights=None):
+    item_ids, inverse = np.unique(items, return_inverse=True)
+    counts = np.bincount(
+        inverse, weights=weights, minlength=len(item_ids)
+    ).astype(np.int64)
+    keep = counts > 0
+    return item_ids[keep], counts[keep]
+
+
+def top_neighbors(first, second, counts, item_ids, item_counts, limit):
+    rows = np.r_[first, second]
+    cols = np.r_[second, first]
+    counts = np.r_[counts, counts]
+    sizes = item_counts[np.searchsorted(item_ids, rows)] * (
+        item_counts[np.searchsorted(item_ids, cols)]
+    )
+    scores = (counts / np.sqrt(np.maximum(sizes, 1))).astype(np.float32)
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    starts = np.searchsorted(rows, rows)
+    keep = np.arange(len(rows)) - starts < limit
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+    indptr = np.searchsorted(rows, item_ids, side='left')
+    return np.r_[indptr, len(rows)], cols, scores
+
+
+def save(path, **arrays):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+def build(incremental=False):
+    path = settings.RECOMMENDATIONS_PATH
+    favorite_id = Favorite.objects.aggregate(id=Max('id'))['id'] or 0
+    cart_id = ShoppingCart.objects.aggregate(id=Max('id'))['id'] or 0
+    if incremental and os.path.exists(path):
+        with np.load(path) as model:
+            state = {name: model[name] for name in model.files}
+        old_favorite_id, old_cart_id = state['watermark']
+        new = np.unique(np.r_[
+            Favorite.objects.filter(
+                id__gt=old_favorite_id, id__lte=favorite_id
+            ).values_list('user_id', flat=True),
+            ShoppingCart.objects.filter(
+                id__gt=old_cart_id, id__lte=cart_id
+            ).values_list('user_id', flat=True),
+        ].astype(np.int64))
+        before = get_interactions(old_favorite_id, old_cart_id, new)
+        after = get_interactions(favorite_id, cart_id, new)
+        old_pairs = cooccurrence(before)
+        new_pairs = cooccurrence(after)
+        first, second, counts = count_pairs(
+            np.r_[state['first'], new_pairs[0], old_pairs[0]],
+            np.r_[state['second'], new_pairs[1], old_pairs[1]],
+            np.r_[state['counts'], new_pairs[2], -old_pairs[2]],
+        )
+        item_ids, item_counts = count_items(
+            np.r_[state['item_ids'], after[:, 1], before[:, 1]],
+            np.r_[
+                state['item_counts'],
+                np.ones(len(after)),
+                -np.ones(len(before)),
+            ],
+        )
+    else:
+        interactions = get_interactions(favorite_id, cart_id)
+        first, second, counts = cooccurrence(interactions)
+        item_ids, item_counts = count_items(interactions[:, 1])
+    indptr, neighbors, scores = top_neighbors(
+        first, second, counts, item_ids, item_counts,
+        settings.RECOMMENDATIONS_NEIGHBORS,
+    )
+    save(
+        path,
+        watermark=np.array((favorite_id, cart_id), dtype=np.int64),
+        first=first,
+        second=second,
+        counts=counts,
+        item_ids=item_ids,
+        item_counts=item_counts,
+        indptr=indptr,
+        neighbors=neighbors,
+        scores=scores,
+    )
+    return len(item_ids), len(first)
+
+
+class Recommender:
+    def __init__(self):
+        self._lock = Lock()
+        self._mtime = None
+        self._model = None
+
+    def get_model(self):
+        path = settings.RECOMMENDATIONS_PATH
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                with np.load(path) as model:
+                    self._model = {
+                        name: model[name]
+                        for name in ('item_ids', 'indptr', 'neighbors',
+                                     'scores')
+                    }
+                self._mtime = mtime
+            return self._model
+
+    def neighbors(self, model, recipe_id):
+        position = np.searchsorted(model['item_ids'], recipe_id)
+        if (
+            position == len(model['item_ids'])
+            or model['item_ids'][position] != recipe_id
+        ):
+            return None
+        start, end = model['indptr'][position], model['indptr'][position + 1]
+        return model['neighbors'][start:end], model['scores'][start:end]
+
+    def similar(self, recipe_id, limit):
+        model = self.get_model()
+        found = model and self.neighbors(model, recipe_id)
+        if not found:
+            return []
+        return found[0][:limit].tolist()
+
+    def recommend(self, recipe_ids, limit):
+        model = self.get_model()
+        if model is None:
+            return []
+        found = [
+            result for result in (
+                self.neighbors(model, recipe_id) for recipe_id in recipe_ids
+            ) if result is not None
+        ]
+        if not found:
+            return []
+        item_ids, inverse = np.unique(
+            np.concatenate([neighbors for neighbors, _ in found]),
+            return_inverse=True,
+        )
+        scores = np.bincount(
+            inverse, weights=np.concatenate([scores for _, scores in found])
+        )
+        scores[np.isin(item_ids, list(recipe_ids))] = -np.inf
+        order = np.argsort(-scores, kind='stable')[:limit]
+        return item_ids[order][np.isfinite(scores[order])].tolist()
+
+
+recommender = Recommender()
@@ -0,0 +1,100 @@
+import re
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+
+from .models import IngredientRecipe, Recipe
+
+TOKEN = re.compile(r'\w+')
+WEIGHTS = {'name': 'A', 'ingredients': 'B', 'text': 'C'}
+SCORES = {'name': 1.0, 'ingredients': 0.4, 'text': 0.2}
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+def get_ingredient_names(recipe_ids=None):
+    rows = IngredientRecipe.objects.values_list(
+        'recipe_id', 'ingredient__name'
+    )
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    names = defaultdict(list)
+    for recipe_id, name in rows:
+        names[recipe_id].append(name)
+    return {
+        recipe_id: ' '.join(recipe_names)
+        for recipe_id, recipe_names in names.items()
+    }
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._postings = None
+
+    def _build(self):
+        ingredients = get_ingredient_names()
+        postings = defaultdict(lambda: defaultdict(float))
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ):
+            for field, value in (
+                ('name', name),
+                ('ingredients', ingredients.get(recipe_id, '')),
+                ('text', text),
+            ):
+                for token in tokenize(value):
+                    postings[token][recipe_id] += SCORES[field]
+        self._postings = postings
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def search(self, query):
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        with self._lock:
+            if self._postings is None:
+                self._build()
+            postings = self._postings
+        matches = [postings.get(token, {}) for token in tokens]
+        recipe_ids = set.intersection(*(set(match) for match in matches))
+        return sorted(
+            recipe_ids,
+            key=lambda recipe_id: (
+                -sum(match[recipe_id] for match in matches), -recipe_id
+            )
+        )
+
+
+search_index = SearchIndex()
+
+
+def update_search_vectors(recipe_ids):
+    if connection.vendor != 'postgresql':
+        search_index.invalidate()
+        return
+    config = settings.SEARCH_CONFIG
+    ingredients = IngredientRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector('name', weight=WEIGHTS['name'], config=config)
+        + SearchVector(
+            Subquery(ingredients),
+            weight=WEIGHTS['ingredients'],
+            config=config,
+        )
+        + SearchVector('text', weight=WEIGHTS['text'], config=config)
+    ))
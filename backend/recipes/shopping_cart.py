@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import IngredientRecipe, ShoppingCartIngredient
+
+
+def apply_changes(user_ids, changes):
+    changes = {
+        ingredient_id: change
+        for ingredient_id, change in changes.items() if change
+    }
+    user_ids = list(user_ids)
+    if not changes or not user_ids:
+        return
+    ShoppingCartIngredient.objects.bulk_create(
+        [
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=0
+            )
+            for user_id in user_ids
+            for ingredient_id, change in changes.items() if change > 0
+        ],
+        ignore_conflicts=True,
+    )
+    rows = ShoppingCartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=changes.keys()
+    )
+    rows.update(
+        amount=F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(change))
+                for ingredient_id, change in changes.items()
+            ),
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    rows.filter(amount__lte=0).delete()
+
+
+def recipe_amounts(recipe_id, sign=1):
+    return {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in IngredientRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    }
+
+
+def add_recipe(user_id, recipe_id):
+    apply_changes((user_id,), recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    apply_changes((user_id,), recipe_amounts(recipe_id, sign=-1))
+
+
+def expected_amounts():
+    return Counter({
+        (row['recipe__shopping_carts__user'], row['ingredient']):
+            row['total']
+        for row in IngredientRecipe.objects.filter(
+            recipe__shopping_carts__isnull=False
+        ).values(
+            'recipe__shopping_carts__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+    })
+
+
+def stored_amounts():
+    return Counter({
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in
+        ShoppingCartIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        )
+    })
+
+
+@transaction.atomic
+def rebuild(expected=None):
+    if expected is None:
+        expected = expected_amounts()
+    ShoppingCartIngredient.objects.all().delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for (user_id, ingredient_id), amount in expected.items()
+        ),
+        batch_size=1000,
+    )
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+from .changes import recipes_changed
+from .counters import change_counter, counter_changed
+from .models import Ingredient, Recipe
+from .shopping_cart import apply_changes, recipe_amounts
+from .versions import ingredients_version
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    transaction.on_commit(ingredients_version.bump)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_carts(instance, **kwargs):
+    apply_changes(
+        instance.shopping_carts.values_list('user_id', flat=True),
+        recipe_amounts(instance.pk, sign=-1),
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    change_counter(User, 'recipes_count', instance.author_id, -1)
+
+
+@receiver(pre_delete, sender=User)
+def decrement_user_counters(instance, **kwargs):
+    if Recipe.objects.filter(favorites__user=instance).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0)
+    ):
+        counter_changed(Recipe, 'favorites_count')
+    Recipe.objects.filter(shopping_carts__user=instance).update(
+        shopping_carts_count=Greatest(F('shopping_carts_count') - 1, 0)
+    )
+    User.objects.filter(subscriber__user=instance).update(
+        subscribers_count=Greatest(F('subscribers_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def mark_recipe_saved(instance, created, update_fields=None, **kwargs):
+    recipes_changed(
+        [instance.pk],
+        search=update_fields is None or bool(
+            {'name', 'text'} & set(update_fields)
+        ),
+        ingredients=created,
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def mark_recipe_deleted(instance, **kwargs):
+    recipes_changed([instance.pk], search=True, ingredients=True)
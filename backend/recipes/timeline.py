@@ -0,0 +1,119 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from users.models import Subscribe, User
+from .models import Recipe, TimelineEntry
+from .utils import batches
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.TIMELINE_WORKERS,
+    thread_name_prefix='recipe-timeline',
+)
+
+
+def trim(user_ids):
+    def cutoff(field):
+        return Subquery(
+            TimelineEntry.objects.filter(
+                user_id=OuterRef('pk')
+            ).order_by('-pub_date', '-recipe_id').values(field)[
+                settings.TIMELINE_LIMIT:settings.TIMELINE_LIMIT + 1
+            ]
+        )
+
+    cutoffs = User.objects.filter(pk__in=user_ids).annotate(
+        cutoff_date=cutoff('pub_date'),
+        cutoff_recipe=cutoff('recipe_id'),
+    ).exclude(cutoff_date=None).values_list(
+        'pk', 'cutoff_date', 'cutoff_recipe'
+    )
+    overflow = [
+        Q(user_id=user_id) & (
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe_id__lte=recipe_id)
+        )
+        for user_id, pub_date, recipe_id in cutoffs
+    ]
+    if overflow:
+        TimelineEntry.objects.filter(reduce(or_, overflow)).delete()
+
+
+def fan_out(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date'
+    ).first()
+    if recipe is None:
+        return
+    followers = Subscribe.objects.filter(
+        author_id=recipe['author_id']
+    ).order_by('pk').values_list('user_id', flat=True).iterator()
+    for user_ids in batches(followers, settings.TIMELINE_BATCH_SIZE):
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                (
+                    TimelineEntry(
+                        user_id=user_id,
+                        recipe_id=recipe_id,
+                        author_id=recipe['author_id'],
+                        pub_date=recipe['pub_date'],
+                    )
+                    for user_id in user_ids
+                ),
+                ignore_conflicts=True,
+            )
+            trim(user_ids)
+
+
+def process_fan_out(recipe_id):
+    close_old_connections()
+    try:
+        fan_out(recipe_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s по лентам', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_fan_out(recipe):
+    return executor.submit(process_fan_out, recipe.pk)
+
+
+def backfill(user_id, author_id):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:settings.TIMELINE_LIMIT]
+        ),
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    for author_id in Subscribe.objects.filter(
+        user_id=user_id
+    ).values_list('author_id', flat=True):
+        backfill(user_id, author_id)
@@ -0,0 +1,48 @@
+import time
+from threading import Lock
+
+from django.conf import settings
+
+from .models import DataVersion
+
+
+class SharedVersion:
+    def __init__(self, name):
+        self.name = name
+        self._lock = Lock()
+        self._value = None
+        self._checked = None
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._checked is None
+                or now - self._checked >= settings.SHARED_VERSION_TTL
+            ):
+                self._value = DataVersion.objects.filter(
+                    name=self.name
+                ).values_list('value', flat=True).first() or 0
+                self._checked = now
+            return self._value
+
+    def bump(self, expected=None):
+        value = time.time_ns()
+        rows = DataVersion.objects.filter(name=self.name)
+        advanced = expected is not None and rows.filter(
+            value=expected
+        ).update(value=value) > 0
+        if not advanced and not rows.update(value=value):
+            DataVersion.objects.update_or_create(
+                name=self.name, defaults={'value': value}
+            )
+        with self._lock:
+            self._value = value
+            self._checked = time.monotonic()
+        return advanced
+
+
+ingredients_version = SharedVersion('ingredients')
+ingredient_sets_version = SharedVersion('ingredient_sets')
+recipes_version = SharedVersion('recipes')
+tags_version = SharedVersion('tags')